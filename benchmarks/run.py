@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# timing the stages of extraction on synthetic pages and comparing the results between versions
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+import lxml.etree
+
+from readability import utils
+from readability.htmls import build_doc
+from readability.htmls import shorten_title
+from readability.readability import Document
+from synthetic import PageGenerator
+
+
+URL = 'http://example.com/article/1'
+
+CASES = OrderedDict([
+    ('small', dict(paragraphs=10, divs=3)),
+    ('medium', dict(paragraphs=100, divs=20)),
+    ('large', dict(paragraphs=1000, divs=200)),
+    ('deep', dict(paragraphs=100, divs=20, depth=60)),
+    ('links', dict(paragraphs=100, divs=20, link_density=0.5)),
+    ('divs', dict(paragraphs=500, divs=500)),
+])
+
+
+def bench_build_doc(generator):
+    page = generator.page().encode('utf-8')
+    return lambda: None, lambda state: build_doc(page)[0]
+
+
+def bench_document(generator):
+    """Everything from the page to the article: parsing, cleaning and both passes if need be."""
+    page = generator.page().encode('utf-8')
+    return lambda: None, lambda state: Document(URL, page).article
+
+
+def bench_document_low_memory(generator):
+    """Document in low memory mode, compare its peak with document's."""
+    page = generator.page().encode('utf-8')
+    return lambda: None, lambda state: Document(URL, page, low_memory=True).article
+
+
+def bench_parse(generator):
+    doc = Document(URL, generator.page().encode('utf-8'))
+
+    def parse(state):
+        doc._article = None
+        return doc.article
+    return lambda: None, parse
+
+
+def bench_score_paragraphs(generator, times=20):
+    """Scores a page times times keeping all the candidates, so the memory they take shows in the peak."""
+    doc = Document(URL, generator.page().encode('utf-8'))
+    html = utils.transform_misused_divs_into_paragraphs(deepcopy(doc.html))
+    index = utils.TextIndex(html)
+
+    def score(state):
+        kept = [utils.score_paragraphs(html, index=index) for i in range(times)]
+        return html
+    return lambda: None, score
+
+
+def bench_parse_table(generator):
+    """Parse with the paragraphs scored over the node table, compare it with parse."""
+    doc = Document(URL, generator.page().encode('utf-8'), scoring='table')
+
+    def parse(state):
+        doc._article = None
+        return doc.article
+    return lambda: None, parse
+
+
+def bench_get_clean_article(generator):
+    doc = Document(URL, generator.page().encode('utf-8'))
+    doc.article
+
+    def serialize(state):
+        doc.get_clean_article()
+        return doc.article
+    return lambda: None, serialize
+
+
+def bench_shorten_title(generator):
+    doc = Document(URL, generator.page().encode('utf-8'))
+
+    def shorten(state):
+        shorten_title(doc.html)
+        return doc.html
+    return lambda: None, shorten
+
+
+def bench_remove_boilerplate(generator, pages=3):
+    docs = [Document(URL, generator.page(number, pages)) for number in range(1, pages + 1)]
+    article = docs[0].article
+    for doc in docs[1:]:
+        article.append(doc.article)
+
+    def remove(combined):
+        utils.remove_boilerplate(combined, pages)
+        return combined
+    return lambda: deepcopy(article), remove
+
+
+OPERATIONS = OrderedDict([
+    ('build_doc', bench_build_doc),
+    ('document', bench_document),
+    ('document_low_memory', bench_document_low_memory),
+    ('parse', bench_parse),
+    ('parse_table', bench_parse_table),
+    ('score_paragraphs', bench_score_paragraphs),
+    ('get_clean_article', bench_get_clean_article),
+    ('shorten_title', bench_shorten_title),
+    ('remove_boilerplate', bench_remove_boilerplate),
+])
+
+
+def peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(case, operation, repeat):
+    """
+    Runs operation on the page of case repeat times, returning the fastest and median seconds, how much the peak
+    memory of the process grew over the first run and the peak resident memory of the process in the end (in KB),
+    and the number of nodes in the tree it left behind.
+    """
+    prepare, run = OPERATIONS[operation](PageGenerator(**CASES[case]))
+    times = []
+    peak = None
+    tree = None
+    for i in range(repeat):
+        state = prepare()
+        before = peak_kb()
+        start = time.time()
+        tree = run(state)
+        times.append(time.time() - start)
+        if peak is None:
+            peak = peak_kb() - before
+    times.sort()
+    return {
+        'case': case,
+        'operation': operation,
+        'seconds': times[0],
+        'median': times[len(times) // 2],
+        'peak_kb': peak,
+        'rss_kb': peak_kb(),
+        'nodes': sum(1 for _ in tree.iter()) if tree is not None else 0,
+    }
+
+
+def measure_in_child(case, operation, repeat):
+    """
+    Measures in a fresh process, so the peak memory of one benchmark doesn't hide that of the next.
+    """
+    queue = multiprocessing.Queue()
+
+    def child():
+        try:
+            queue.put(measure(case, operation, repeat))
+        except Exception, e:
+            queue.put({'case': case, 'operation': operation, 'error': '%s: %s' % (type(e).__name__, e)})
+    process = multiprocessing.Process(target=child)
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def run_benchmarks(cases=None, operations=None, repeat=5, label=None, isolate=True):
+    """
+    Returns the results of the operations on the cases, along with what they were run on, ready to be saved.
+    """
+    results = OrderedDict()
+    for case in cases or CASES:
+        for operation in operations or OPERATIONS:
+            if isolate:
+                result = measure_in_child(case, operation, repeat)
+            else:
+                result = measure(case, operation, repeat)
+            results['%s/%s' % (case, operation)] = result
+    return {
+        'label': label,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'lxml': lxml.etree.__version__,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=1.25):
+    """
+    Returns lines comparing two saved runs and the keys of the benchmarks that got slower or used more memory by
+    more than threshold times.
+    """
+    lines = ['%-32s %10s %10s %7s %10s %10s' % ('benchmark', 'old ms', 'new ms', 'ratio', 'old KB', 'new KB')]
+    regressions = []
+    for key, result in new['results'].iteritems():
+        before = old['results'].get(key)
+        if before is None or 'error' in before or 'error' in result:
+            lines.append('%-32s %s' % (key, result.get('error') or (before or {}).get('error') or 'new'))
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else 1.0
+        # differences of less than a millisecond or a megabyte are mostly noise from the scheduler and allocator
+        slower = ratio > threshold and result['seconds'] - before['seconds'] > 0.001
+        grew = result['peak_kb'] > max(before['peak_kb'] * threshold, before['peak_kb'] + 1024)
+        flag = ''
+        if slower or grew:
+            regressions.append(key)
+            flag = ' <-- slower' if slower else ' <-- more memory'
+        lines.append('%-32s %10.2f %10.2f %7.2f %10d %10d%s' % (
+            key, before['seconds'] * 1000, result['seconds'] * 1000, ratio, before['peak_kb'], result['peak_kb'],
+            flag))
+    return lines, regressions
+
+
+def format_results(run):
+    lines = ['%-32s %10s %10s %10s %10s %8s' % ('benchmark', 'ms', 'median ms', 'peak KB', 'RSS KB', 'nodes')]
+    for key, result in run['results'].iteritems():
+        if 'error' in result:
+            lines.append('%-32s %s' % (key, result['error']))
+        else:
+            lines.append('%-32s %10.2f %10.2f %10d %10d %8d' % (
+                key, result['seconds'] * 1000, result['median'] * 1000, result['peak_kb'], result.get('rss_kb', 0),
+                result['nodes']))
+    return lines
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog: [options]")
+    parser.add_option('-c', '--cases', default=None, help="comma separated cases to run (%s)" % ','.join(CASES))
+    parser.add_option('-o', '--operations', default=None, help="comma separated operations to run (%s)" % ','.join(OPERATIONS))
+    parser.add_option('-r', '--repeat', type='int', default=5, help="runs of each benchmark, the fastest is kept")
+    parser.add_option('-l', '--label', default=None, help="name for this run, e.g. the version")
+    parser.add_option('-s', '--save', default=None, help="write the results to this json file")
+    parser.add_option('--compare', default=None, help="compare with the results saved in this json file, exits with 1 if anything regressed")
+    parser.add_option('--threshold', type='float', default=1.25, help="how many times slower or bigger counts as a regression")
+    (options, args) = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    run = run_benchmarks(options.cases.split(',') if options.cases else None,
+                         options.operations.split(',') if options.operations else None,
+                         options.repeat, options.label)
+    print '\n'.join(format_results(run))
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(run, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            old = json.load(f, object_pairs_hook=OrderedDict)
+        lines, regressions = compare(old, run, options.threshold)
+        print
+        print '\n'.join(lines)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# synthetic article pages of tunable size and shape, so benchmarks don't need the network
+import random
+
+
+WORDS = (u'the of and to in is was that for on are with as his they be at one have this from or had by word but '
+         u'what some we can out other were all there when up use your how said an each she which do their time if '
+         u'will way about many then them write would like so these her long make thing see him two has look more '
+         u'day could go come did number sound no most people my over know water than call first who may down side '
+         u'been now find café naïve über').split()
+NAV_CLASSES = ['menu', 'sidebar', 'footer', 'comment', 'related', 'social', 'widget', 'header']
+
+
+class PageGenerator(object):
+    """
+    Generates pages that look like an article inside the usual clutter of a site: a header, a menu, sidebars full
+    of links, comments and a footer.
+
+    The same seed and settings always give the same page.
+    """
+
+    def __init__(self, paragraphs=30, depth=4, link_density=0.1, divs=20, seed=0):
+        """
+        :param paragraphs: number of paragraphs in the article, the main knob for the size of the page
+        :param depth: how many wrapper divs the article is nested in
+        :param link_density: fraction of the words of the article's paragraphs that are links
+        :param divs: number of divs used as paragraphs (with only text and inline tags in them) in the article
+        :param seed: seed for the words and the order of things
+        """
+        self.paragraphs = paragraphs
+        self.depth = depth
+        self.link_density = link_density
+        self.divs = divs
+        self.seed = seed
+
+    def sentence(self, r, words=12, link_density=0.0):
+        out = []
+        i = 0
+        while i < words:
+            if link_density and r.random() < link_density:
+                length = min(r.randint(1, 4), words - i)
+                out.append(u'<a href="/%s">%s</a>' % (r.randint(1, 500), u' '.join(r.choice(WORDS) for _ in range(length))))
+                i += length
+            else:
+                out.append(r.choice(WORDS))
+                i += 1
+        return u' '.join(out).capitalize() + u', ' + r.choice(WORDS) + u'.'
+
+    def text(self, r, sentences, link_density=0.0):
+        return u' '.join(self.sentence(r, r.randint(8, 20), link_density) for _ in range(sentences))
+
+    def links(self, r, count):
+        return u''.join(u'<li><a href="/section/%d">%s</a></li>' % (r.randint(1, 100), self.sentence(r, 3))
+                        for _ in range(count))
+
+    def article(self, r):
+        blocks = []
+        divs = min(self.divs, self.paragraphs)
+        for i in range(self.paragraphs):
+            tag = 'div' if i < divs else 'p'
+            blocks.append(u'<%s>%s</%s>' % (tag, self.text(r, r.randint(2, 6), self.link_density), tag))
+            if i % 10 == 5:
+                blocks.append(u'<h2>%s</h2><img src="/img/%d.jpg" alt="">' % (self.sentence(r, 5), i))
+        r.shuffle(blocks)
+        html = u'<h1 class="title">%s</h1>%s' % (self.sentence(r, 8), u''.join(blocks))
+        for level in range(self.depth):
+            html = u'<div class="%s">%s</div>' % ('article-body' if level == 0 else 'wrap%d' % level, html)
+        return html
+
+    def boilerplate(self, r):
+        """
+        Returns the header and footer shared by every page of a site.
+        """
+        header = u'<div class="header"><a href="/">%s</a><ul class="menu">%s</ul></div>' % (
+            self.sentence(r, 3), self.links(r, 12))
+        footer = u'<div class="footer"><p>%s</p><ul>%s</ul></div>' % (self.text(r, 2), self.links(r, 8))
+        return header, footer
+
+    def page(self, number=1, pages=1):
+        """
+        Returns page number of an article of pages pages as unicode, the pages of one article share their
+        boilerplate and link to each other.
+        """
+        header, footer = self.boilerplate(random.Random(self.seed))
+        r = random.Random('%s-%s' % (self.seed, number))
+        sidebar = u'<div class="sidebar"><h3>%s</h3><ul>%s</ul></div>' % (self.sentence(r, 3), self.links(r, 20))
+        comments = u'<div class="comments">%s</div>' % u''.join(
+            u'<div class="comment"><p>%s</p></div>' % self.text(r, 2) for _ in range(max(1, self.paragraphs / 10)))
+        paging = u''
+        if number < pages:
+            paging = u'<div class="pagination"><a href="/article/%d">next</a></div>' % (number + 1)
+        return (u'<html><head><title>%s | Example News</title></head><body>%s<div class="main">%s%s%s</div>%s%s'
+                u'</body></html>' % (self.sentence(r, 8), header, self.article(r), paging, comments, sidebar, footer))
@@ -1 +1,2 @@
 from .readability import Document
+from .batch import extract_many
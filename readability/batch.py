@@ -0,0 +1,123 @@
+# extracting articles from many documents at once in a pool of worker processes
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+
+from readability import Document
+from readability import NotArticle
+from readability import Unparseable
+
+
+# index is the position of the document in the input, error is the Unparseable or NotArticle it failed with,
+# seconds is how long the extraction took, cached whether the article came from the cache and rejected_by why the
+# prefilter turned the page down before parsing it, if it did
+ExtractionResult = namedtuple('ExtractionResult', ['index', 'url', 'article', 'error', 'seconds', 'cached',
+                                                   'rejected_by'])
+
+
+class BadRecord(Unparseable):
+    """
+    A record of the input that couldn't be read, given in place of its html so it is reported as a failure.
+    """
+
+
+# the ArticleCache of a worker process, set up by the pool
+_worker_cache = None
+
+
+def _init_worker(cache):
+    global _worker_cache
+    _worker_cache = cache
+
+
+def extract(job, cache=None):
+    """
+    Extracts the clean article of a single (index, url, html, options) job.
+
+    Only strings and exceptions are sent back to the caller, never lxml trees. Errors other than Unparseable and
+    NotArticle are reported as Unparseable so that everything returned can be pickled.
+
+    :param cache: ArticleCache to look the article up in and store it in, defaults to the worker's
+    """
+    index, url, html, options = job
+    if cache is None:
+        cache = _worker_cache
+    start = time.time()
+    cached = False
+    rejected_by = None
+    try:
+        if isinstance(html, BadRecord):
+            raise html
+        if not html:
+            # Document would go and download the page instead
+            raise Unparseable('empty document')
+        if cache is not None:
+            key = cache.key(url, html, **options)
+            cached, article = cache.get(key)
+        if not cached:
+            doc = Document(url, html, **options)
+            article = doc.get_clean_article() if doc.is_article else None
+            rejected_by = doc.rejected_by
+            if cache is not None:
+                cache.set(key, article)
+        if article is None:
+            raise NotArticle()
+        return ExtractionResult(index, url, article, None, time.time() - start, cached, rejected_by)
+    except (Unparseable, NotArticle), e:
+        return ExtractionResult(index, url, None, e, time.time() - start, cached, rejected_by)
+    except Exception, e:
+        error = Unparseable('%s: %s' % (type(e).__name__, e))
+        return ExtractionResult(index, url, None, error, time.time() - start, cached, rejected_by)
+
+
+def extract_many(documents, processes=None, chunksize=1, ordered=True, cache=None, **options):
+    """
+    Extracts the articles of many documents, parsing and scoring them in a pool of worker processes.
+
+    Results are streamed back as ExtractionResult tuples while the pool works through the documents. Documents are
+    read from the iterable only a few chunks ahead of the results, so it can be a lazily read corpus of any size.
+    A document that can't be extracted gets a result with its error instead of stopping the batch.
+
+    :param documents: iterable of (url, html) pairs, html a BadRecord for records that couldn't be read
+    :param processes: number of worker processes, defaults to the number of CPUs; 1 extracts in this process
+    :param chunksize: number of documents sent to a worker at a time
+    :param ordered: yield results in the order of the documents rather than as they complete
+    :param cache: ArticleCache for the articles, every worker process gets a copy of it so an in-memory one is
+        only shared with processes=1, an SqliteCache backend is shared by all of them
+    :param options: keyword arguments for Document, e.g. min_article_length or prefilter
+    """
+    jobs = ((index, url, html, options) for index, (url, html) in enumerate(documents))
+    if processes == 1:
+        for job in jobs:
+            yield extract(job, cache)
+        return
+
+    # the pool pulls jobs from the iterable in a thread of its own as fast as it can, hold it back to a few chunks
+    # per worker ahead of what has been handed out
+    ahead = threading.Semaphore((processes or multiprocessing.cpu_count()) * chunksize * 2)
+    stopped = threading.Event()
+
+    def throttled(jobs):
+        for job in jobs:
+            ahead.acquire()
+            if stopped.is_set():
+                return
+            yield job
+
+    pool = multiprocessing.Pool(processes, _init_worker, (cache,))
+    try:
+        if ordered:
+            results = pool.imap(extract, throttled(jobs), chunksize)
+        else:
+            results = pool.imap_unordered(extract, throttled(jobs), chunksize)
+        for result in results:
+            ahead.release()
+            yield result
+        pool.close()
+    finally:
+        # the pool waits for the thread feeding it when terminating, don't leave that thread blocked
+        stopped.set()
+        ahead.release()
+        pool.terminate()
+        pool.join()
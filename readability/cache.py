@@ -0,0 +1,210 @@
+# caches for extracted articles
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from encoding import from_content_type
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded mapping that forgets the least recently used entries first.
+
+    If ttl is given, entries older than ttl seconds are treated as missing.
+    """
+
+    def __init__(self, max_entries=1000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, stored = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.ttl is not None and time.time() - stored > self.ttl:
+                self.misses += 1
+                return default
+            # re-inserting moves it to the most recently used end
+            self._entries[key] = value, stored
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value, time.time()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses}
+
+
+class SqliteCache(object):
+    """
+    A size bounded mapping of strings (or None) kept in an sqlite database, forgetting the least recently used
+    entries first. It can be shared by processes, each one opens its own connection.
+    """
+
+    def __init__(self, path, max_entries=100000, timeout=30):
+        """
+        :param path: file of the database, created if it doesn't exist
+        :param max_entries: entries beyond this are evicted, least recently used first
+        :param timeout: seconds to wait for another process writing to the database
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_connection'] = state['_pid'] = state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        # a connection doesn't survive being forked into a worker process
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            # readers don't wait for writers, and marking an entry as used doesn't wait for the disk
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, used REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key, default=None):
+        with self._lock:
+            db = self.connection
+            row = db.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            db.execute('UPDATE entries SET used = ? WHERE key = ?', (time.time(), key))
+            db.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            db = self.connection
+            db.execute('INSERT OR REPLACE INTO entries (key, value, used) VALUES (?, ?, ?)', (key, value, time.time()))
+            excess = db.execute('SELECT COUNT(*) FROM entries').fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)', (excess,))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses}
+
+
+# options of Document that don't change the article
+UNKEYED_OPTIONS = ('fetcher', 'trace', 'timer', 'low_memory', 'scoring')
+# options of Document whose value doesn't change the article but whether they are given can
+SWITCH_OPTIONS = ('profiles',)
+# part of every key, change it when the extraction changes so old articles are no longer used
+KEY_VERSION = '2'
+
+
+class ArticleCache(object):
+    """
+    Caches clean articles by the content of the page they were extracted from and how they were extracted, so
+    a page seen before (crawled again, syndicated, retried) isn't parsed again.
+
+    The url is part of the key as links in the article are made absolute with it.
+    """
+
+    def __init__(self, backend=None):
+        """
+        :param backend: LRUCache, SqliteCache or anything with get(key, default) and set(key, value) for strings,
+            an LRUCache of 1000 articles by default
+        """
+        self.backend = backend if backend is not None else LRUCache()
+
+    def key(self, url, text, content_type=None, **options):
+        digest = hashlib.sha1(KEY_VERSION)
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+            charset = 'unicode'
+        else:
+            # only the charset of the content type affects the article
+            charset = from_content_type(content_type) or ''
+        keyed = []
+        for name, value in sorted(options.iteritems()):
+            if name in SWITCH_OPTIONS:
+                if value is None:
+                    continue
+                value = True
+            if name not in UNKEYED_OPTIONS:
+                keyed.append((name, value))
+        for part in (url or '', charset, repr(keyed)):
+            digest.update(part.encode('utf-8') if isinstance(part, unicode) else part)
+            digest.update('\0')
+        digest.update(text)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns whether the key was found and its article, None if the page wasn't an article.
+        """
+        article = self.backend.get(key, self)
+        if article is self:
+            return False, None
+        return True, article
+
+    def set(self, key, article):
+        self.backend.set(key, article)
+
+    def clean_article(self, url, text, content_type=None, **options):
+        """
+        Returns the clean article of the page like Document(url, text, ...).get_clean_article(), or None if it
+        isn't an article, without parsing the page if it has been seen before.
+        """
+        from readability import Document
+        key = self.key(url, text, content_type, **options)
+        found, article = self.get(key)
+        if not found:
+            doc = Document(url, text, content_type=content_type, **options)
+            article = doc.get_clean_article() if doc.is_article else None
+            self.set(key, article)
+        return article
+
+    def stats(self):
+        return self.backend.stats()
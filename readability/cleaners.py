@@ -1,5 +1,7 @@
 # strip out a set of nuisance html attributes that can mess up rendering in RSS feeds
 import re
+from lxml import etree
+from lxml.etree import tounicode
 from lxml.html.clean import Cleaner
 
 bad_attrs = ['width', 'height', 'style', '[-a-z]*color', 'background[-a-z]*', 'on*']
@@ -15,12 +17,65 @@ htmlstrip = re.compile("<" # open
 , re.I)
 
 
+# the same attributes on the tree, and written out inside an attribute value where htmlstrip finds them too
+badAttrRe = re.compile('(?:%s)$' % '|'.join(bad_attrs), re.I)
+badAttrInValueRe = re.compile(' (?:%s) *=' % '|'.join(bad_attrs), re.I)
+# attribute name -> whether it is a bad one
+_bad_names = {}
+
+
 def clean_attributes(html):
     while htmlstrip.search(html):
         html = htmlstrip.sub('<\\1\\2>', html)
     return html
 
 
+def is_bad_attribute(name):
+    bad = _bad_names.get(name)
+    if bad is None:
+        bad = badAttrRe.match(name) is not None
+        if len(_bad_names) < 1024:
+            _bad_names[name] = bad
+    return bad
+
+
+def tounicode_clean(elem):
+    """
+    Returns the html of elem without the bad attributes, the same as clean_attributes(tounicode(elem)).
+
+    The attributes are taken off the tree in one pass and put back after serializing, rather than rescanning the
+    html once for every attribute removed. htmlstrip only matches attributes with a value, and can match inside a
+    value as well, in which case this leaves it to clean_attributes.
+    """
+    if not etree.iselement(elem):
+        return clean_attributes(tounicode(elem))
+    stripped = []
+    for node in elem.iter(etree.Element):
+        items = node.items()
+        bad = None
+        for name, value in items:
+            if ' ' in value and badAttrInValueRe.search(value):
+                return clean_attributes(tounicode(elem))
+            if value and is_bad_attribute(name):
+                if bad is None:
+                    bad = []
+                bad.append(name)
+        if bad is not None:
+            stripped.append((node, items, bad))
+    for node, items, bad in stripped:
+        attrib = node.attrib
+        for name in bad:
+            del attrib[name]
+    try:
+        return tounicode(elem)
+    finally:
+        # put them back in their original order
+        for node, items, bad in stripped:
+            node.attrib.clear()
+            for name, value in items:
+                node.set(name, value)
+
+
 def normalize_spaces(s):
     if not s: return ''
     """replace any sequence of whitespace
@@ -0,0 +1,186 @@
+# reading (url, html) records of a crawl for bulk extraction
+import json
+import logging
+import math
+import time
+
+from batch import BadRecord
+from batch import extract_many
+
+
+log = logging.getLogger()
+
+
+def read_jsonl(stream):
+    """
+    Yields (url, html) pairs from JSON lines with "url" and "html" keys, skipping blank lines. Lines that aren't
+    JSON objects give a BadRecord for the html.
+    """
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError, e:
+            yield None, BadRecord('line %d: %s' % (number, e))
+            continue
+        if not isinstance(record, dict):
+            yield None, BadRecord('line %d: not a JSON object' % number)
+            continue
+        yield record.get('url'), record.get('html')
+
+
+class CountedStream(object):
+    """
+    Counts the bytes read from a stream, for the offsets of its records.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offset = 0
+
+    def readline(self):
+        line = self.stream.readline()
+        self.offset += len(line)
+        return line
+
+    def read(self, size):
+        data = self.stream.read(size)
+        self.offset += len(data)
+        return data
+
+
+def read_warc_headers(stream, line=None):
+    """
+    Returns the WARC headers of the next record by their lowercase names, or None at the end of the stream.
+
+    :param line: the first line of the record if it has been read already
+    """
+    headers = {}
+    if line is None:
+        line = stream.readline()
+    # records are separated by blank lines
+    while line in ('\r\n', '\n'):
+        line = stream.readline()
+    if not line:
+        return None
+    if not line.startswith('WARC/'):
+        raise ValueError('not a WARC record: %r' % line[:40])
+    for line in iter(stream.readline, ''):
+        line = line.rstrip('\r\n')
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def read_warc(stream):
+    """
+    Yields (url, html) pairs from the response and resource records of an uncompressed WARC stream.
+
+    HTTP headers at the start of response records are stripped, other record types are skipped. Records that can't
+    be read give a BadRecord for the html, the stream is read on from the next line that starts a record.
+    """
+    stream = CountedStream(stream)
+    line = None
+    while True:
+        offset = stream.offset - len(line or '')
+        headers = None
+        try:
+            headers = read_warc_headers(stream, line)
+            if headers is None:
+                return
+            length = int(headers.get('content-length', 0))
+            if length < 0:
+                raise ValueError('negative Content-Length %d' % length)
+        except ValueError, e:
+            yield (headers or {}).get('warc-target-uri'), BadRecord('record at offset %d: %s' % (offset, e))
+            # where its block ends isn't known
+            line = next((found for found in iter(stream.readline, '') if found.startswith('WARC/')), '')
+            continue
+        line = None
+        block = stream.read(length)
+        kind = headers.get('warc-type')
+        if kind not in ('response', 'resource'):
+            continue
+        if kind == 'response' and block.startswith('HTTP/'):
+            for separator in ('\r\n\r\n', '\n\n'):
+                if separator in block:
+                    block = block.split(separator, 1)[1]
+                    break
+        yield headers.get('warc-target-uri'), block
+
+
+READERS = {
+    'jsonl': read_jsonl,
+    'warc': read_warc,
+}
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of a sorted list of values, e.g. fraction 0.99 for p99.
+    """
+    if not values:
+        return 0
+    rank = int(math.ceil(fraction * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def extract_corpus(records, output, processes=None, chunksize=1, **options):
+    """
+    Extracts the articles of (url, html) records, writing each one to output as a JSON line as soon as it is done.
+
+    Records that can't be read or extracted are logged and skipped.
+
+    :param records: iterable of (url, html) pairs, e.g. from read_jsonl or read_warc
+    :param output: file to write {"url": ..., "article": ...} lines to
+    :param processes: number of worker processes, see extract_many
+    :returns: dict with the number of documents, failures, records that couldn't be read, articles found in the
+        cache, pages the prefilter turned down, the total seconds and sorted per-document latencies
+    """
+    start = time.time()
+    documents = failed = unreadable = cached = rejected = 0
+    latencies = []
+    for result in extract_many(records, processes=processes, chunksize=chunksize, ordered=False, **options):
+        documents += 1
+        cached += result.cached
+        rejected += result.rejected_by is not None
+        latencies.append(result.seconds)
+        if result.error is not None:
+            failed += 1
+            unreadable += isinstance(result.error, BadRecord)
+            log.warning('skipping %s: %s %s' % (result.url or 'a record', type(result.error).__name__, result.error))
+            continue
+        output.write(json.dumps({'url': result.url, 'article': result.article}) + '\n')
+        output.flush()
+    latencies.sort()
+    return {
+        'documents': documents,
+        'failed': failed,
+        'unreadable': unreadable,
+        'cached': cached,
+        'rejected': rejected,
+        'seconds': time.time() - start,
+        'latencies': latencies,
+    }
+
+
+def format_summary(summary):
+    seconds = summary['seconds']
+    failed = '%d failed' % summary['failed']
+    if summary.get('cached'):
+        failed += ', %d cached' % summary['cached']
+    line = '%d documents (%s) in %.2fs, %.1f documents/sec, latency p50 %.1f ms, p99 %.1f ms' % (
+        summary['documents'],
+        failed,
+        seconds,
+        summary['documents'] / seconds if seconds else 0,
+        percentile(summary['latencies'], 0.5) * 1000,
+        percentile(summary['latencies'], 0.99) * 1000)
+    if summary.get('unreadable'):
+        line += ', %d of the failed unreadable' % summary['unreadable']
+    if summary.get('rejected'):
+        line += ', %d of the failed turned down by the prefilter' % summary['rejected']
+    return line
@@ -1,21 +1,164 @@
+import codecs
+import logging
 import re
+from collections import Counter
+
 import chardet
 
-def get_encoding(page):
-    text = re.sub('</?[^>]*>\s*', ' ', page)
-    enc = 'utf-8'
-    if not text.strip() or len(text) < 10:
-        return enc # can't guess
+
+# byte order marks, longest first so UTF-32 isn't taken for UTF-16
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+charsetRe = re.compile(r'charset\s*=\s*["\']?\s*([-\w.:]+)', re.I)
+metaCharsetRe = re.compile(r'<meta[^>]+?charset\s*=\s*["\']?\s*([-\w.:]+)', re.I)
+# how far into the page to look for a <meta> charset, how much of it to give chardet and to decode at once
+META_BYTES = 4096
+SAMPLE_BYTES = 65536
+DECODE_CHUNK = 65536
+
+# how many pages each strategy decided, for monitoring
+strategies = Counter()
+
+log = logging.getLogger()
+
+
+def normalize_encoding(enc):
+    """
+    Returns the python codec name for a declared encoding, or None if python doesn't know it.
+    """
+    if not enc:
+        return None
     try:
-        diff = text.decode(enc, 'ignore').encode(enc)
-        sizes = len(diff), len(text)
-        if abs(len(text) - len(diff)) < max(sizes) * 0.01: # 99% of utf-8
+        name = codecs.lookup(enc).name
+    except LookupError:
+        return None
+    if name == 'mac-cyrillic':
+        return 'cp1251'
+    return name
+
+
+def from_bom(page):
+    for bom, enc in BOMS:
+        if page.startswith(bom):
             return enc
+    return None
+
+
+def from_content_type(content_type):
+    if not content_type:
+        return None
+    match = charsetRe.search(content_type)
+    return normalize_encoding(match.group(1)) if match else None
+
+
+def from_meta(page):
+    match = metaCharsetRe.search(page, 0, META_BYTES)
+    if not match:
+        return None
+    enc = normalize_encoding(match.group(1))
+    if enc and enc.startswith('utf-16'):
+        # a page that could be read far enough to find this isn't UTF-16, browsers take it to mean UTF-8
+        return 'utf-8'
+    return enc
+
+
+def decodes(page, codec):
+    """
+    Checks that the page decodes with codec a chunk at a time, stopping at the first invalid byte.
+    """
+    decoder = codecs.getincrementaldecoder(codec)()
+    try:
+        for start in xrange(0, len(page), DECODE_CHUNK):
+            decoder.decode(page[start:start + DECODE_CHUNK])
+        decoder.decode('', final=True)
     except UnicodeDecodeError:
-        pass
-    res = chardet.detect(text)
-    enc = res['encoding']
-    #print '->', enc, "%.2f" % res['confidence']
-    if enc == 'MacCyrillic':
-        enc = 'cp1251'
+        return False
+    return True
+
+
+def is_utf8(page):
+    return decodes(page, 'utf-8')
+
+
+def is_ascii(page):
+    """
+    Checks that the page is plain ASCII, without the escapes of the 7-bit ISO-2022 encodings.
+    """
+    return '\x1b' not in page and decodes(page, 'ascii')
+
+
+def guess(page):
+    """
+    Guesses the encoding from the text of the start of the page, the way get_encoding always has.
+    """
+    text = re.sub('</?[^>]*>\s*', ' ', page[:SAMPLE_BYTES])
+    if not text.strip() or len(text) < 10:
+        return 'utf-8', 'default'  # can't guess
+    diff = text.decode('utf-8', 'ignore').encode('utf-8')
+    if abs(len(text) - len(diff)) < len(text) * 0.01:  # 99% of utf-8
+        return 'utf-8', 'utf-8'
+    enc = normalize_encoding(chardet.detect(text)['encoding'])
+    return enc or 'utf-8', 'chardet' if enc else 'default'
+
+
+def detect_encoding(page, content_type=None):
+    """
+    Returns the encoding of the page and the strategy that found it.
+
+    The cheapest sources are tried first: a byte order mark ('bom'), the charset of the HTTP Content-Type
+    header ('http'), a <meta> charset near the start of the page ('meta') and a check that the page is valid
+    UTF-8 ('utf-8'). Only if none of them settles it is chardet run on a sample of the text ('chardet', or
+    'default' if there isn't enough text to tell).
+
+    :param page: the page as a byte string
+    :param content_type: value of the Content-Type header the page was served with, if any
+    """
+    return sniff_encoding(page, content_type)[:2]
+
+
+def sniff_encoding(page, content_type=None):
+    """
+    Returns the encoding of the page and the strategy that found it like detect_encoding, and whether the page
+    turned out to be valid UTF-8 along the way: True or False, or None if that wasn't checked.
+    """
+    enc, strategy = declared_encoding(page, content_type)
+    if enc:
+        return enc, strategy, None
+    if is_utf8(page):
+        return 'utf-8', 'utf-8', True
+    return guess(page) + (False,)
+
+
+def declared_encoding(page, content_type=None):
+    """
+    Returns the encoding the page declares by a byte order mark, its Content-Type or a <meta> charset, and which of
+    them it was, or (None, None). Only the first META_BYTES of the page are looked at.
+    """
+    enc = from_bom(page)
+    if enc:
+        return enc, 'bom'
+    enc = from_content_type(content_type)
+    if enc:
+        return enc, 'http'
+    enc = from_meta(page)
+    if enc:
+        return enc, 'meta'
+    return None, None
+
+
+def get_encoding(page, content_type=None):
+    return counted(*detect_encoding(page, content_type))
+
+
+def counted(enc, strategy):
+    """
+    Counts the strategy that found the encoding of a page and returns the encoding.
+    """
+    strategies[strategy] += 1
+    log.debug('encoding %s found by %s', enc, strategy)
     return enc
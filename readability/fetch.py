@@ -0,0 +1,171 @@
+# fetching pages over shared keep-alive connections, with per-host limits and prefetching
+import logging
+import sys
+import threading
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger()
+
+
+class PendingFetch(object):
+    """
+    A page being fetched in the background.
+    """
+
+    def __init__(self, fetcher, url):
+        self.url = url
+        self._page = None
+        self._error = None
+        self._done = threading.Event()
+        thread = threading.Thread(target=self._run, args=(fetcher,), name='prefetch %s' % url)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, fetcher):
+        try:
+            self._page = fetcher.fetch_raw(self.url)
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the page and returns its content and Content-Type, re-raising any error the fetch ran into.
+        """
+        if not self._done.wait(timeout):
+            raise requests.Timeout('prefetch of %s did not finish' % self.url)
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._page
+
+
+class StreamedPage(object):
+    """
+    A page being downloaded, iterating over it gives the chunks of its undecoded content as they arrive.
+
+    The request counts towards the host's limit until the content is read through or the page is closed.
+    """
+
+    def __init__(self, response, slot, chunk_size):
+        self.url = response.url
+        self.content_type = response.headers.get('content-type')
+        self._response = response
+        self._slot = slot
+        self._chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            iter_content = getattr(self._response, 'iter_content', None)
+            if iter_content is None:
+                # a session that can't stream
+                yield self._response.content
+            else:
+                for chunk in iter_content(self._chunk_size):
+                    if chunk:
+                        yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self._slot is not None:
+            self._response.close()
+            self._slot.release()
+            self._slot = None
+
+
+class Fetcher(object):
+    """
+    Fetches pages through one requests.Session so connections are kept alive and reused.
+
+    The session is pluggable: anything with a requests style get(url, timeout=...) method returning an object with
+    content, text and headers attributes will do, which makes it easy to put a cache or a different transport
+    underneath.
+    """
+
+    def __init__(self, session=None, timeout=10, max_per_host=2):
+        """
+        :param session: session to fetch with, a keep-alive requests.Session is created if not given
+        :param timeout: seconds to wait for the server to connect and to send data
+        :param max_per_host: how many requests may be in flight to a single host at once
+        """
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max_per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host_slots(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._hosts[host]
+
+    def get(self, url):
+        with self._host_slots(url):
+            log.debug('fetching %s', url)
+            return self.session.get(url, timeout=self.timeout)
+
+    def fetch(self, url):
+        """
+        Returns the text of the page at url, decoded by requests.
+        """
+        return self.get(url).text
+
+    def fetch_raw(self, url):
+        """
+        Returns the undecoded content of the page at url and its Content-Type header, for build_doc to decode.
+        """
+        response = self.get(url)
+        return response.content, response.headers.get('content-type')
+
+    def stream(self, url, chunk_size=16384):
+        """
+        Starts fetching the page at url and returns a StreamedPage once its headers are in, so the content can be
+        parsed as it arrives. The session has to take requests' stream argument.
+
+        :param chunk_size: the most bytes to read at once
+        """
+        slot = self._host_slots(url)
+        slot.acquire()
+        try:
+            log.debug('streaming %s', url)
+            response = self.session.get(url, timeout=self.timeout, stream=True)
+        except Exception:
+            slot.release()
+            raise
+        return StreamedPage(response, slot, chunk_size)
+
+    def prefetch(self, url):
+        """
+        Starts fetching url in the background and returns a PendingFetch for it.
+        """
+        return PendingFetch(self, url)
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher():
+    """
+    Returns the Fetcher shared by documents that aren't given one.
+    """
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
@@ -1,25 +1,258 @@
 from cleaners import normalize_spaces, clean_attributes
-from encoding import get_encoding
+from encoding import is_ascii, is_utf8, sniff_encoding
+from encoding import META_BYTES, counted, declared_encoding
+from lxml import etree
 from lxml.html import tostring
+import codecs
 import logging
 import lxml.html
 import re, sys
+from copy import deepcopy
 
 
 utf8_parser = lxml.html.HTMLParser(encoding='utf-8')
+ASCII = ''.join(map(chr, range(128)))
+# whether each encoding decodes plain ASCII as ASCII
+_ascii_compatible = {}
 
+# the elements that may hold the title without the site's name, in the order shorten_title looks at them
+TITLE_SELECTORS = ['h1', 'h2', 'h3', '#title', '#head', '#heading', '.pageTitle', '.news_title', '.title', '.head',
+                   '.heading', '.contentheading', '.small_header_red']
+# the candidates that aren't headings are among these
+_with_id_or_class = etree.XPath('descendant-or-self::*[@id or @class]')
+# the class names as the XPath cssselect writes for '.name' sees them
+_class_names = re.compile('[^ \t\r\n]+').findall
+# put before the first <meta> of a page parsed in chunks: libxml2 switches to the encoding of the first <meta>
+# charset it finds in a chunk after the first, the page is fed to it as UTF-8 whatever it declares
+STREAM_MARKER = u'<meta charset="utf-8" data-readability-stream="">'
+# what the marker is put before, and the comments, scripts and styles a '<meta' in the text of isn't a <meta>
+_marker_scan = re.compile(r'<(!--|script\b|style\b|meta\b)', re.I)
+_marker_skip_ends = {'!--': re.compile('-->'), 'script': re.compile(r'</script', re.I),
+                     'style': re.compile(r'</style', re.I)}
 
-def build_doc(page):
+
+def ascii_compatible(enc):
+    if enc not in _ascii_compatible:
+        _ascii_compatible[enc] = ASCII.decode(enc, 'replace') == ASCII.decode('ascii')
+    return _ascii_compatible[enc]
+
+
+def build_doc(page, content_type=None):
+    """
+    Parses the page, returning the document and the encoding it was decoded with (None for unicode pages).
+
+    lxml is always handed UTF-8, it parses that faster and in less memory than unicode strings. Pages that already
+    are UTF-8, or plain ASCII in an encoding that agrees with it, are parsed as they are instead of being decoded
+    and encoded again.
+
+    :param content_type: Content-Type header the page was served with, its charset is used for byte strings
+    """
     if isinstance(page, unicode):
         enc = None
         page_unicode = page
     else:
-        enc = get_encoding(page) or 'utf-8'
+        enc, strategy, utf8 = sniff_encoding(page, content_type)
+        enc = counted(enc, strategy) or 'utf-8'
+        if utf8 is None and enc == 'utf-8':
+            # only declared, the page wasn't checked yet
+            utf8 = is_utf8(page)
+        # a page that isn't valid UTF-8 isn't plain ASCII either
+        if utf8 or utf8 is None and ascii_compatible(enc) and is_ascii(page):
+            return lxml.html.document_fromstring(page, parser=utf8_parser), enc
         page_unicode = page.decode(enc, 'replace')
     doc = lxml.html.document_fromstring(page_unicode.encode('utf-8', 'replace'), parser=utf8_parser)
     return doc, enc
 
 
+class DocBuilder(object):
+    """
+    Builds the document of a page from its chunks as they arrive, the same document build_doc makes of the whole
+    page, so parsing overlaps with the download.
+
+    The encoding is decided once the first META_BYTES are in, by what the page declares (see declared_encoding).
+    Pages that declare nothing are taken for UTF-8 as long as they are valid UTF-8; if one turns out not to be, it
+    is parsed with build_doc once all of it is in.
+
+    Element names parsed from more than a few chunks aren't all found by lxml's tag matching (iter('p') and the
+    like), so the document is copied once it is complete.
+    """
+
+    def __init__(self, content_type=None, keep_page=True, max_size=None):
+        """
+        :param content_type: Content-Type header the page is served with
+        :param keep_page: keep the chunks to join them into page, else page is None
+        :param max_size: the page is cut down to max_size bytes like truncate_page does, feed returns False once
+            it has been
+        """
+        self.content_type = content_type
+        self.keep_page = keep_page
+        self.max_size = max_size
+        self.page = None
+        self.size = 0
+        self.truncated = False
+        self._chunks = []
+        self._encoding = None
+        self._strategy = None
+        self._decoder = None
+        self._parser = None
+        # the page declares no encoding and isn't UTF-8
+        self._failed = False
+        # the text from the last '<' on, fed with the next chunk
+        self._held = u''
+        self._marked = False
+        # the end of the comment, script or style the last chunk ended in while looking for the first <meta>, and
+        # what followed its start in that chunk
+        self._skip_end = None
+        self._skipped = u''
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the page, returns False if the page is cut down there and no more is needed.
+        """
+        if self.max_size is not None and self.size + len(chunk) > self.max_size:
+            limit = self.max_size - self.size
+            end = chunk.rfind('<', 0, limit + 1)
+            if end < 0 or end == 0 and not self.size:
+                end = limit
+            chunk = chunk[:end]
+            self.truncated = True
+        self.size += len(chunk)
+        if self._encoding is None:
+            self._chunks.append(chunk)
+            if self.size >= META_BYTES:
+                self._start()
+        else:
+            if self.keep_page or self._strategy is None:
+                self._chunks.append(chunk)
+            self._parse(chunk)
+        return not self.truncated
+
+    def _start(self):
+        head = ''.join(self._chunks)
+        self._encoding, self._strategy = declared_encoding(head, self.content_type)
+        if self._encoding is None:
+            # checked chunk by chunk instead of all at once like is_utf8 does
+            self._encoding = 'utf-8'
+            self._decoder = codecs.getincrementaldecoder('utf-8')()
+        else:
+            self._decoder = codecs.getincrementaldecoder(self._encoding)('replace')
+        self._chunks = [head] if self.keep_page or self._strategy is None else []
+        self._parser = lxml.html.HTMLParser(encoding='utf-8')
+        self._parse(head)
+
+    def _parse(self, chunk, final=False):
+        if self._failed:
+            return
+        try:
+            text = self._decoder.decode(chunk, final)
+        except UnicodeDecodeError:
+            self._failed = True
+            self._parser = None
+            return
+        text = self._held + text
+        self._held = u''
+        if not final:
+            # libxml2 can misread a tag cut in two by the end of a chunk (e.g. the </script> ending a script), so
+            # the chunks it is fed end before a tag
+            cut = text.rfind(u'<')
+            if cut >= 0:
+                text, self._held = text[:cut], text[cut:]
+        if not self._marked:
+            text = self._mark(text)
+        if text:
+            self._parser.feed(text.encode('utf-8'))
+
+    def _mark(self, text):
+        """
+        Returns text with STREAM_MARKER put before the page's first <meta> if it is in text, skipping the comments,
+        scripts and styles that may span chunks.
+        """
+        pos = 0
+        while True:
+            if self._skip_end is not None:
+                # the end of a comment can be cut in two by the end of a chunk
+                skipped = self._skipped if not pos else u''
+                searched = skipped + text
+                found = self._skip_end.search(searched, pos)
+                if found is None:
+                    self._skipped = searched[max(pos, len(searched) - 2):]
+                    return text
+                pos = found.end() - len(skipped)
+                self._skip_end = None
+            found = _marker_scan.search(text, pos)
+            if found is None:
+                return text
+            name = found.group(1).lower()
+            if name == 'meta':
+                self._marked = True
+                return text[:found.start()] + STREAM_MARKER + text[found.start():]
+            self._skip_end = _marker_skip_ends[name]
+            pos = found.end()
+
+    def close(self):
+        """
+        Returns the document and the encoding it was decoded with, like build_doc.
+        """
+        if self._encoding is None:
+            self._start()
+        self._parse('', final=True)
+        page = ''.join(self._chunks) if self._chunks else None
+        self._chunks = []
+        if self._failed or not self.size:
+            # build_doc goes on to guess the encoding, or fails on an empty page
+            doc, enc = build_doc(page or '', self.content_type)
+        else:
+            parsed = self._parser.close()
+            if parsed is None:
+                raise etree.ParserError('Document is empty')
+            doc, enc = deepcopy(parsed), counted(self._encoding, self._strategy or 'utf-8')
+            # the doctype decides how the document is serialized
+            info, copied = parsed.getroottree().docinfo, doc.getroottree().docinfo
+            copied.public_id, copied.system_url = info.public_id, info.system_url
+            if self._marked:
+                for meta in doc.iter('meta'):
+                    if meta.get('data-readability-stream') is not None:
+                        meta.drop_tree()
+                        break
+        self._parser = None
+        self.page = page if self.keep_page else None
+        return doc, enc
+
+
+def truncate_page(page, max_size):
+    """
+    Returns the first max_size characters (or bytes) of the page, cut before a tag rather than in the middle of one,
+    the parser closes whatever is left open.
+    """
+    if len(page) <= max_size:
+        return page
+    end = page.rfind('<', 0, max_size + 1)
+    return page[:end if end > 0 else max_size]
+
+
+def truncate_tree(doc, max_nodes):
+    """
+    Removes the nodes of doc after the first max_nodes in document order, returns whether there were any.
+    """
+    for count, last in enumerate(doc.iter(), 1):
+        if count >= max_nodes:
+            break
+    else:
+        return False
+    # the nodes after last are its descendants and the following siblings of it and of its ancestors
+    truncated = len(last) > 0
+    del last[:]
+    elem = last
+    while elem is not None:
+        following = elem.getnext()
+        while following is not None:
+            truncated = True
+            elem.getparent().remove(following)
+            following = elem.getnext()
+        elem = elem.getparent()
+    return truncated
+
+
 def js_re(src, pattern, flags, repl):
     return re.compile(pattern, flags).sub(src, repl.replace('$', '\\'))
 
@@ -57,6 +290,26 @@ def add_match(collection, text, orig):
         if text.replace('"', '') in orig.replace('"', ''):
             collection.add(text)
 
+def title_candidates(doc):
+    """
+    Returns the elements matching each of TITLE_SELECTORS, in that order and each in document order.
+
+    Rather than a walk over the tree for every selector there is one for the headings and one for the elements with
+    an id or a class, matched against the selectors in python.
+    """
+    found = dict((selector, []) for selector in TITLE_SELECTORS)
+    for e in doc.iterdescendants('h1', 'h2', 'h3'):
+        found[e.tag].append(e)
+    for e in _with_id_or_class(doc):
+        selector = '#' + e.get('id', '')
+        if selector in found:
+            found[selector].append(e)
+        for name in set(_class_names(e.get('class', ''))):
+            selector = '.' + name
+            if selector in found:
+                found[selector].append(e)
+    return [found[selector] for selector in TITLE_SELECTORS]
+
 def shorten_title(doc):
     title = doc.find('.//title')
     if title is None or title.text is None or len(title.text) == 0:
@@ -66,19 +319,15 @@ def shorten_title(doc):
 
     candidates = set()
 
-    for item in ['.//h1', './/h2', './/h3']:
-        for e in list(doc.iterfind(item)):
-            if e.text:
-                add_match(candidates, e.text, orig)
-            if e.text_content():
-                add_match(candidates, e.text_content(), orig)
-
-    for item in ['#title', '#head', '#heading', '.pageTitle', '.news_title', '.title', '.head', '.heading', '.contentheading', '.small_header_red']:
-        for e in doc.cssselect(item):
+    for elements in title_candidates(doc):
+        for e in elements:
             if e.text:
                 add_match(candidates, e.text, orig)
-            if e.text_content():
-                add_match(candidates, e.text_content(), orig)
+            # without children that is the text again
+            if len(e):
+                content = e.text_content()
+                if content:
+                    add_match(candidates, content, orig)
 
     if candidates:
         title = sorted(candidates, key=len)[-1]
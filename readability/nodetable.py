@@ -0,0 +1,134 @@
+# paragraph scoring over a flat table of the nodes of a page, finding the same candidates as utils.score_paragraphs
+import logging
+
+from lxml import etree
+
+from utils import TextIndex
+from utils import describe
+from utils import score_node
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+log = logging.getLogger()
+
+# the tags paragraphs are scored for, numbered in the order utils.tags yields them
+PARAGRAPH_KINDS = {'p': 1, 'pre': 2, 'td': 3}
+
+
+class NodeTable(object):
+    """
+    The elements of a tree flattened into columns, one row per element in document order.
+
+    parent holds the row of each element's parent (-1 for none), kind the PARAGRAPH_KINDS number of the paragraphs
+    (0 for the other elements) and text_length, commas and link_length the statistics of the TextIndex. If the root
+    has a parent it gets the last row, so the paragraphs right under the root have a grandparent like they do in
+    the tree, but it is never a paragraph itself.
+    """
+
+    def __init__(self, html, index):
+        elems = list(html.iter(etree.Element))
+        rows = dict((elem, row) for row, elem in enumerate(elems))
+        outside = html.getparent()
+        if outside is not None:
+            rows[outside] = len(elems)
+            elems.append(outside)
+        kind = [0] * len(elems)
+        # like utils.tags, only the descendants of html
+        for elem in html.iterdescendants(*PARAGRAPH_KINDS):
+            kind[rows[elem]] = PARAGRAPH_KINDS[elem.tag]
+        self.elems = elems
+        self.kind = kind
+        self.parent = [rows.get(elem.getparent(), -1) for elem in elems]
+        self.text_length, self.commas, self.link_length = index.columns(elems)
+
+    def __len__(self):
+        return len(self.elems)
+
+
+def _propagate_numpy(table, min_len):
+    parent = numpy.array(table.parent, dtype=numpy.intp)
+    kind = numpy.array(table.kind, dtype=numpy.int8)
+    length = numpy.array(table.text_length, dtype=numpy.int64)
+    commas = numpy.array(table.commas, dtype=numpy.int64)
+    # parent[-1] is the last row, those are masked out again
+    grand = numpy.where(parent >= 0, parent[parent], -1)
+
+    paragraphs = numpy.flatnonzero((kind > 0) & (length >= min_len) & (parent >= 0))
+    # all the p first, then the pre, then the td, each in document order
+    paragraphs = paragraphs[numpy.argsort(kind[paragraphs], kind='mergesort')]
+    scores = 2 + commas[paragraphs] + numpy.minimum(length[paragraphs] // 100, 3)
+    parents = parent[paragraphs]
+    grands = grand[paragraphs]
+    has_grand = grands >= 0
+
+    met = numpy.column_stack((parents, grands)).ravel()
+    met = met[met >= 0]
+    rows, first = numpy.unique(met, return_index=True)
+    ordered = rows[numpy.argsort(first, kind='mergesort')]
+
+    totals = numpy.zeros(len(table))
+    numpy.add.at(totals, parents, scores)
+    numpy.add.at(totals, grands[has_grand], scores[has_grand] / 2.0)
+    halved = numpy.zeros(len(table), dtype=bool)
+    halved[grands[has_grand]] = True
+    return ordered.tolist(), totals.tolist(), halved.tolist()
+
+
+def _propagate_lists(table, min_len):
+    parent, kind, length, commas = table.parent, table.kind, table.text_length, table.commas
+    paragraphs = [row for row in xrange(len(table)) if kind[row] and length[row] >= min_len and parent[row] >= 0]
+    paragraphs.sort(key=kind.__getitem__)
+
+    ordered = []
+    met = [False] * len(table)
+    totals = [0.0] * len(table)
+    halved = [False] * len(table)
+    for row in paragraphs:
+        score = 2 + commas[row] + min(length[row] // 100, 3)
+        up = parent[row]
+        grand = parent[up]
+        for candidate in (up, grand):
+            if candidate >= 0 and not met[candidate]:
+                met[candidate] = True
+                ordered.append(candidate)
+        totals[up] += score
+        if grand >= 0:
+            totals[grand] += score / 2.0
+            halved[grand] = True
+    return ordered, totals, halved
+
+
+def score_paragraphs(html, min_len=25, index=None, trace=None):
+    """
+    Scores each paragraph in the document except for those that are less than min length, like
+    utils.score_paragraphs does but column by column over a NodeTable, with NumPy if it is installed.
+
+    :param index: TextIndex of html, built here if not given
+    :param trace: Trace to record the final score of each candidate in
+    :returns: a dict of candidate element to its Candidate
+    """
+    if index is None:
+        index = TextIndex(html)
+    table = NodeTable(html, index)
+    propagate = _propagate_numpy if numpy is not None else _propagate_lists
+    ordered, totals, halved = propagate(table, min_len)
+
+    candidates = {}
+    debug = log.isEnabledFor(logging.DEBUG)
+    for row in ordered:
+        elem = table.elems[row]
+        candidate = score_node(elem)
+        # only the grandparents' halves make a score a float before it is scaled
+        score = candidate.content_score + (totals[row] if halved[row] else int(totals[row]))
+        ld = float(table.link_length[row]) / max(table.text_length[row], 1)
+        if debug:
+            log.debug("Candid: %6.3f %s link density %.3f -> %6.3f", score, describe(elem), ld, score * (1 - ld))
+        if trace is not None:
+            trace.record('candidate', elem, score=score, link_density=ld, final_score=score * (1 - ld))
+        candidate.content_score = score * (1 - ld)
+        candidates[elem] = candidate
+    return candidates
@@ -0,0 +1,129 @@
+# a quick look at a page before parsing it, to turn down the pages that clearly aren't articles
+import threading
+from collections import Counter
+from collections import namedtuple
+
+from lxml import etree
+
+
+# text_length counts every character of the page's text, whitespace included, link_length those inside links and
+# paragraphs the runs of text between two tags, outside links, with at least min_paragraph_length characters once
+# their whitespace is collapsed
+PageStats = namedtuple('PageStats', ['text_length', 'link_length', 'paragraphs'])
+
+_text_length = etree.XPath('string-length(.)')
+_paragraphs = etree.XPath('count(.//text()[string-length(normalize-space(.)) >= $length][not(ancestor::a)])')
+
+
+def link_length(html):
+    """
+    Returns the number of characters of text inside the links of html.
+    """
+    length = 0
+    for a in html.iter('a'):
+        if len(a):
+            length += len(a.text_content())
+        elif a.text:
+            length += len(a.text)
+    return length
+
+
+def page_stats(html, min_paragraph_length=25):
+    """
+    Returns the PageStats of html, e.g. to choose the thresholds of a Prefilter on a sample of pages.
+
+    Only the links are visited in python, the rest is counted by libxml2.
+    """
+    return PageStats(int(_text_length(html)), link_length(html),
+                     int(_paragraphs(html, length=min_paragraph_length)))
+
+
+class Prefilter(object):
+    """
+    Turns down pages that clearly aren't articles before they are parsed, by the length of their text, the number
+    of paragraphs in it and how much of it is in links.
+
+    With the defaults only pages with less text than an article of the document's min_article_length are turned
+    down, which never changes what is_article says. Index, listing and product pages usually need the other
+    thresholds too, e.g. Prefilter(min_paragraphs=3, max_link_density=0.6): unlike the defaults these are guesses,
+    check them against page_stats of a sample of the pages first.
+
+    It counts the pages it checked and those it turned down by reason, it is safe to share between threads.
+    """
+
+    def __init__(self, min_text_length=None, min_paragraphs=0, max_link_density=None, min_paragraph_length=25):
+        """
+        :param min_text_length: pages with fewer characters of text are turned down, defaults to the
+            min_article_length of the document
+        :param min_paragraphs: pages with fewer paragraphs are turned down
+        :param max_link_density: pages with a bigger share of their text in links are turned down
+        :param min_paragraph_length: characters a run of text needs to count as a paragraph
+        """
+        self.min_text_length = min_text_length
+        self.min_paragraphs = min_paragraphs
+        self.max_link_density = max_link_density
+        self.min_paragraph_length = min_paragraph_length
+        self.checked = 0
+        # reason -> number of pages turned down for it
+        self.rejected = Counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        # also what the options of an ArticleCache key are made of
+        return 'Prefilter(min_text_length=%r, min_paragraphs=%r, max_link_density=%r, min_paragraph_length=%r)' % (
+            self.min_text_length, self.min_paragraphs, self.max_link_density, self.min_paragraph_length)
+
+    def __getstate__(self):
+        # sent to worker processes without the lock, which can't be pickled
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def check(self, html, min_article_length=0):
+        """
+        Returns why html clearly isn't an article, 'text', 'paragraphs' or 'links', or None if it may be one.
+
+        Only what the thresholds need is counted, with the defaults that is just the length of the text.
+
+        :param html: the lxml document element
+        :param min_article_length: the document's, for the default min_text_length
+        """
+        min_text_length = self.min_text_length
+        if min_text_length is None:
+            min_text_length = min_article_length
+        text_length = _text_length(html)
+        reason = None
+        if text_length < min_text_length:
+            reason = 'text'
+        elif self.min_paragraphs and _paragraphs(html, length=self.min_paragraph_length) < self.min_paragraphs:
+            reason = 'paragraphs'
+        elif self.max_link_density is not None and link_length(html) > self.max_link_density * text_length:
+            reason = 'links'
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] += 1
+        return reason
+
+    def stats(self):
+        with self._lock:
+            return {'checked': self.checked, 'rejected': sum(self.rejected.values()), 'reasons': dict(self.rejected)}
+
+
+_default_prefilter = None
+_default_lock = threading.Lock()
+
+
+def default_prefilter():
+    """
+    Returns the Prefilter shared by documents that aren't given one.
+    """
+    global _default_prefilter
+    with _default_lock:
+        if _default_prefilter is None:
+            _default_prefilter = Prefilter()
+        return _default_prefilter
@@ -0,0 +1,160 @@
+# what was learned about the pages of each site, so the later pages of a site can be parsed around its article
+import json
+import os
+import threading
+from collections import OrderedDict
+from urlparse import urlparse
+
+
+# the passes turn <div>s into <p>s, they are counted as one so the paths they learn still fit the page
+SIBLING_TAGS = {'div': ('div', 'p'), 'p': ('div', 'p')}
+# Document gives the body an id of its own
+MATCHED_BY_TAG = ('html', 'body')
+
+
+def _attributes(elem):
+    if elem.tag in MATCHED_BY_TAG:
+        return '', ''
+    return elem.get('id', ''), elem.get('class', '')
+
+
+def path_of(elem):
+    """
+    Returns the steps from the root of elem's tree down to elem, each a [tag, id, class, n] list where n counts the
+    preceding siblings with the same tag (see SIBLING_TAGS), id and class. The id and class of the html and body
+    are left out.
+    """
+    steps = []
+    parent = elem.getparent()
+    while parent is not None:
+        attributes = _attributes(elem)
+        n = 0
+        for sibling in elem.itersiblings(*SIBLING_TAGS.get(elem.tag, (elem.tag,)), preceding=True):
+            if _attributes(sibling) == attributes:
+                n += 1
+        steps.append([elem.tag] + list(attributes) + [n])
+        elem, parent = parent, parent.getparent()
+    steps.reverse()
+    return steps
+
+
+def find_path(root, path):
+    """
+    Returns the element path_of gave path for in a tree with the same structure as root's, or None.
+    """
+    elem = root
+    for tag, id, cls, n in path:
+        for child in elem.iterchildren(*SIBLING_TAGS.get(tag, (tag,))):
+            if _attributes(child) == (id, cls):
+                if not n:
+                    break
+                n -= 1
+        else:
+            return None
+        if child.tag != tag:
+            return None
+        elem = child
+    return elem
+
+
+def host_of(url):
+    return urlparse(url).netloc if url else None
+
+
+class SiteProfiles(object):
+    """
+    Remembers for each host where the best candidate of its pages was, so Document can score the next pages of the
+    host around it (see its profiles argument) instead of scoring the whole page.
+
+    A profile is the path_of the best candidate, whether the ruthless pass found it and whether it was the page's
+    only <article>. Looking a host up counts as a miss if it has no profile; Document then counts whether the
+    profile was used (a hit) or didn't fit the page (rejected), in which case the page is parsed in full and the
+    profile learned again. At most max_hosts are kept, the least recently learned are forgotten first.
+
+    The profiles can be kept in a JSON file: they are read from path when it exists and written to it by save.
+    """
+
+    def __init__(self, path=None, max_hosts=10000):
+        """
+        :param path: JSON file to read the profiles from and save them to
+        :param max_hosts: profiles beyond this are forgotten, least recently learned first
+        """
+        self.path = path
+        self.max_hosts = max_hosts
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """
+        Returns the profile of the host of url, or None.
+        """
+        with self._lock:
+            profile = self._profiles.get(host_of(url))
+            if profile is None:
+                self.misses += 1
+            return profile
+
+    def used(self, url, fitted):
+        """
+        Counts whether the profile get returned for url fitted the page.
+        """
+        with self._lock:
+            if fitted:
+                self.hits += 1
+            else:
+                self.rejected += 1
+
+    def learn(self, url, path, ruthless, article):
+        """
+        Remembers that the best candidate of the page at url was at path.
+
+        :param ruthless: whether the ruthless pass found it
+        :param article: whether it was the page's only <article>
+        """
+        host = host_of(url)
+        if not host:
+            return
+        with self._lock:
+            self._profiles.pop(host, None)
+            self._profiles[host] = {'path': path, 'ruthless': ruthless, 'article': article}
+            while len(self._profiles) > self.max_hosts:
+                self._profiles.popitem(last=False)
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            profiles = json.load(f, object_pairs_hook=OrderedDict)
+        with self._lock:
+            self._profiles.update(profiles)
+
+    def save(self, path=None):
+        """
+        Writes the profiles to path, or to the path they were read from.
+        """
+        path = path or self.path
+        with self._lock:
+            data = json.dumps(self._profiles)
+        # written next to it and renamed, so a crash doesn't leave half a file
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.rename(temporary, path)
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def stats(self):
+        return {'hosts': len(self), 'hits': self.hits, 'misses': self.misses, 'rejected': self.rejected}
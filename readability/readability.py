@@ -3,21 +3,40 @@
 import logging
 import sys
 from copy import deepcopy
+from operator import attrgetter
 
-from lxml.etree import tounicode
-
+import nodetable
 import requests
 import utils
-from cleaners import clean_attributes
+from lxml import etree
 from cleaners import html_cleaner
+from cleaners import tounicode_clean
+from fetch import default_fetcher
+from htmls import DocBuilder
 from htmls import build_doc
 from htmls import get_title
 from htmls import shorten_title
+from htmls import truncate_page
+from htmls import truncate_tree
+from prefilter import default_prefilter
+from profiles import find_path
+from profiles import path_of
+from tracing import StageClock
+from tracing import Trace
 
 
-logging.basicConfig(level=logging.INFO)
 log = logging.getLogger()
 
+# how Document can score the paragraphs, see its scoring argument
+SCORERS = {
+    'tree': utils.score_paragraphs,
+    'table': nodetable.score_paragraphs,
+}
+
+
+# the links get_next_page_url looks for the next page among, all but those in the comments
+next_page_candidates = etree.XPath("descendant-or-self::*[(not(@id) or (@id!='disqus_thread' and @id!='comments')) and (not(@class) or @class!='userComments')]/a")
+
 
 class Unparseable(ValueError):
     pass
@@ -34,31 +53,106 @@ class Document:
     TEXT_LENGTH_THRESHOLD = 25
     RETRY_LENGTH = 250
 
-    def __init__(self, url, text=None, page=1, min_article_length=250, min_article_percentage=0.075):
+    def __init__(self, url, text=None, page=1, min_article_length=250, min_article_percentage=0.075, fetcher=None,
+                 content_type=None, trace=None, timer=None, prefilter=None, low_memory=False, max_size=None,
+                 max_nodes=None, stream=False, scoring='tree', profiles=None):
         """
         :param url: the url of the document
         :param text: optionally the string value of the page may be passed in
         :param page: if this is one in a series of documents in an article this should be set
         :param min_article_length: if an article is less than this number of characters it's not an article
         :param min_article_percentage: an article must be this % of the text on the page
+        :param fetcher: Fetcher used to download the page if text isn't given, defaults to a shared one
+        :param content_type: Content-Type header the text was served with, helps to decode it
+        :param trace: Trace to record the scoring decisions made while parsing in
+        :param timer: called with the name, seconds and resulting node count of every stage of the work, e.g. a
+            tracing.Timings
+        :param prefilter: Prefilter that is_article asks first, pages it turns down aren't parsed; defaults to a shared
+            one that only turns down pages with too little text
+        :param low_memory: don't keep the page's text once it is parsed (text is None), and parse in less memory
+            at the cost of some time, for very large pages
+        :param max_size: only the first max_size characters (bytes for byte strings) of longer pages are parsed
+        :param max_nodes: the nodes of the cleaned page after the first max_nodes are removed before parsing
+        :param stream: if text isn't given, parse the page as it downloads rather than once all of it is in (timed
+            as the 'stream' stage)
+        :param scoring: 'tree' to score the paragraphs element by element or 'table' to flatten the tree into columns
+            first and score those, with NumPy if it is installed; both find the same candidates
+        :param profiles: SiteProfiles to learn where the article of the site's pages is in and, once it knows, to
+            parse only around it as long as it is still the best candidate there, see parse
         """
+        if scoring not in SCORERS:
+            raise ValueError('unknown scoring %r, expected one of %s' % (scoring, ', '.join(sorted(SCORERS))))
         self.url = url
         self.page = page
+        self.trace = trace
+        self.timer = timer
+        self.prefilter = prefilter or default_prefilter()
+        # 'ruthless' or 'conservative', the pass that found the article
+        self.parsed_by = None
+        # why the prefilter turned the page down, if it did
+        self.rejected_by = None
+        self._prefiltered = False
+        # 'size' or 'nodes', the limit the page was cut down to if it was
+        self.truncated = None
         self._article = None
+        self.low_memory = low_memory
+        self.scoring = scoring
+        self.profiles = profiles
         self.min_article_length = min_article_length
         self.min_article_percentage = min_article_percentage
 
-        if text:
-            self.text = text
+        clock = StageClock(timer)
+        if not text and stream:
+            doc = self._stream(fetcher or default_fetcher(), max_size)
+            clock.lap('stream', doc)
         else:
-            self.text = requests.get(url).text
-
-        # parses the HTML and cleans it up removing elements this doesn't want to deal with (e.g., head, script, form)
-        doc, self.encoding = build_doc(self.text)
-        doc = html_cleaner.clean_html(doc)
+            if text:
+                self.text = text
+            else:
+                self.text, content_type = (fetcher or default_fetcher()).fetch_raw(url)
+                clock.lap('fetch')
+            text = self.text
+            if max_size is not None and len(text) > max_size:
+                log.info('Page of %d characters cut down to %d', len(text), max_size)
+                text = truncate_page(text, max_size)
+                self.truncated = 'size'
+            if low_memory:
+                # the tree is all that's needed from here on
+                self.text = None
+            # parses the HTML and cleans it up removing elements this doesn't want to deal with (e.g., head, script, form)
+            doc, self.encoding = build_doc(text, content_type)
+            del text
+            clock.lap('build_doc', doc)
+        # clean in place, clean_html would make a copy of the whole tree
+        html_cleaner(doc)
+        clock.lap('clean', doc)
+        if max_nodes is not None:
+            if truncate_tree(doc, max_nodes):
+                log.info('Page cut down to %d nodes', max_nodes)
+                self.truncated = 'nodes'
+            clock.lap('truncate', doc)
         doc.make_links_absolute(self.url, resolve_base_href=True)
+        clock.lap('make_links_absolute', doc)
         self.html = doc
 
+    def _stream(self, fetcher, max_size):
+        """
+        Fetches and parses the page at the same time, returning the document.
+        """
+        page = fetcher.stream(self.url)
+        builder = DocBuilder(page.content_type, keep_page=not self.low_memory, max_size=max_size)
+        try:
+            for chunk in page:
+                if not builder.feed(chunk):
+                    log.info('Page cut down to %d bytes', max_size)
+                    self.truncated = 'size'
+                    break
+        finally:
+            page.close()
+        doc, self.encoding = builder.close()
+        self.text = builder.page
+        return doc
+
     def title(self):
         return get_title(self.html)
 
@@ -69,22 +163,34 @@ class Document:
         """
         Returns a string version of the html with attributes removed.
         """
-        return clean_attributes(tounicode(self.article))
+        return tounicode_clean(self.article)
 
     @property
     def is_article(self):
         """
         Returns True if this is an article.
 
-        Start off by determining this via the length of the article.
+        Pages the prefilter turns down aren't parsed at all. Start off by determining this via the length of the
+        article.
         """
+        if self._article is None and not self._prefiltered:
+            self._prefiltered = True
+            clock = StageClock(self.timer)
+            self.rejected_by = self.prefilter.check(self.html, self.min_article_length)
+            clock.lap('prefilter')
+            if self.rejected_by is not None:
+                log.info('Not an article, turned down by the prefilter (%s)', self.rejected_by)
+                if self.trace is not None:
+                    self.trace.record('rejected', reason=self.rejected_by)
+        if self.rejected_by is not None:
+            return False
         if not self.article:
             return False
         article_len = utils.text_length(self.article)
         if article_len < self.min_article_length:
             return False
         percent = float(article_len) / utils.text_length(self.html)
-        logging.info('Article is %f %% of the documemnt' % percent)
+        log.info('Article is %f %% of the documemnt', percent)
         return percent >= self.min_article_percentage
 
     @property
@@ -99,8 +205,7 @@ class Document:
         """
         # if this is a media wiki page, skip it
 
-        LinkCandidateXPathQuery = "descendant-or-self::*[(not(@id) or (@id!='disqus_thread' and @id!='comments')) and (not(@class) or @class!='userComments')]/a"
-        candidates = self.html.xpath(LinkCandidateXPathQuery)
+        candidates = next_page_candidates(self.html)
 
         best = None
         best_score = 0
@@ -119,105 +224,325 @@ class Document:
     def parse(self):
         """
         Attempts to create an cleaned article version of this document.
+
+        With profiles, if the site's profile has the best candidate of its pages at a path the page has too, only the
+        parent of that element is copied and scored, by the pass that found it. The profile is used if the element is
+        still the best candidate there (or the page's only <article>) and the article is long enough, otherwise the
+        page is parsed in full and the profile learned again.
         """
+        trace = self.trace
+
         def select_best_candidate(candidates):
             """
             Returns the candidate with the highest content score.
             """
-            sorted_candidates = sorted(candidates.values(), key=lambda x: x['content_score'], reverse=True)
-            for candidate in sorted_candidates[:5]:
-                elem = candidate['elem']
-                self.debug("Top 5 : %6.3f %s" % (candidate['content_score'], utils.describe(elem)))
+            sorted_candidates = sorted(candidates.values(), key=attrgetter('content_score'), reverse=True)
+            if log.isEnabledFor(logging.DEBUG):
+                for candidate in sorted_candidates[:5]:
+                    self.debug("Top 5 : %6.3f %s", candidate.content_score, utils.describe(candidate.elem))
             if len(sorted_candidates) == 0:
                 return None
             return sorted_candidates[0]
 
-        def do_parse(ruthless):
+        def forget_ruthless_copy():
+            ruthless_pass.clear()
+            if pruned_nodes:
+                del pruned_nodes[:]
+
+        def profiled_copy(profile):
+            """
+            Returns a copy of the parent of the element the profile points to, pruned like the pass that learned it
+            would and inside empty copies of its ancestors, and the element in the copy; or None if the page has no
+            such element or that pass would drop it.
+            """
+            elem = find_path(self.html, profile['path'])
+            if elem is None or elem.getparent() is None:
+                return None
+            parent = elem.getparent()
+            dropped = []
+            if profile['ruthless'] and unlikely:
+                dropping = set(unlikely)
+                if elem in dropping or any(ancestor in dropping for ancestor in elem.iterancestors()):
+                    return None
+                dropped = [node for node in unlikely if parent in node.iterancestors()]
+            html = utils.pruned_copy(parent, dropped)
+            # elem isn't dropped, in the copy it comes after the siblings before it that aren't
+            dropped = set(dropped)
+            copied = html[sum(1 for sibling in elem.itersiblings(preceding=True) if sibling not in dropped)]
+            # the ancestors make the parent a descendant, transformed and scored as in the whole page
+            for ancestor in parent.iterancestors():
+                wrapper = ancestor.makeelement(ancestor.tag, ancestor.attrib)
+                wrapper.append(html)
+                html = wrapper
+            return html, copied
+
+        def profiled_candidate(profile, elem, candidates, index):
+            """
+            Returns the candidate of the profile's element if the pass that learned it would still choose it.
+            """
+            if profile['article']:
+                if elem.tag != 'article' or sum(1 for node in self.html.iter('article')) != 1:
+                    return None
+                candidate = utils.score_node(elem, True, index)
+            else:
+                candidate = candidates.get(elem)
+                if candidate is None or any(other.content_score > candidate.content_score
+                                            for other in candidates.itervalues()):
+                    return None
+            return candidate if candidate.content_score > 0 else None
+
+        def do_parse(ruthless, profile=None):
+            if trace is not None:
+                if profile is None:
+                    trace.record('pass', ruthless=ruthless)
+                else:
+                    trace.record('profile', ruthless=ruthless, article=profile['article'])
+            if profile is not None:
+                prefix = 'profile:'
+            else:
+                prefix = 'ruthless:' if ruthless else 'conservative:'
+            clock = StageClock(self.timer, prefix)
             try:
-                html = deepcopy(self.html)
+                known = None
+                if profile is not None:
+                    copied = profiled_copy(profile)
+                    if copied is None:
+                        return None
+                    html, profiled = copied
+                elif ruthless:
+                    # the unlikely candidates are left out while copying rather than copied and then dropped
+                    html = utils.pruned_copy(self.html, unlikely, pruned_nodes)
+                elif 'index' in ruthless_pass:
+                    # the text of everything but the unlikely candidates and their ancestors is the same as in
+                    # the ruthless pass, so only those are indexed again
+                    html, same = utils.restored_copy(self.html, unlikely, pruned_nodes)
+                    known = ruthless_pass.pop('index').shared_with(same)
+                    # nothing else holds on to the ruthless copy, let it go before this one is worked on
+                    del same
+                    forget_ruthless_copy()
+                else:
+                    html = deepcopy(self.html)
+                clock.lap('copy', html)
                 for i in utils.tags(html, 'script', 'style'):
                     i.drop_tree()
                 for i in utils.tags(html, 'body'):
                     i.set('id', 'readabilityBody')
-                if ruthless:
-                    html = utils.remove_unlikely_candidates(html)
                 html = utils.transform_misused_divs_into_paragraphs(html)
-
-                candidates = utils.score_paragraphs(html)
-
-                # first try to get an article
-                article_node = utils.get_article_element(html)
-                if article_node:
-                    best_candidate = article_node
+                clock.lap('transform_divs', html)
+
+                # text lengths, link lengths and comma counts for every node, shared by scoring and sanitizing
+                index = utils.TextIndex(html, known, keep_pieces=not self.low_memory)
+                clock.lap('index', html)
+                if ruthless and pruned_nodes is not None and profile is None:
+                    ruthless_pass['index'] = index
+                candidates = SCORERS[self.scoring](html, index=index, trace=trace)
+                clock.lap('score_paragraphs', html)
+
+                if profile is not None:
+                    article_node = None
+                    best_candidate = profiled_candidate(profile, profiled, candidates, index)
+                    reason = 'site profile'
                 else:
-                    best_candidate = select_best_candidate(candidates)
+                    # first try to get an article
+                    article_node = utils.get_article_element(html, index)
+                    if article_node:
+                        best_candidate = article_node
+                    else:
+                        best_candidate = select_best_candidate(candidates)
+                    reason = 'the only <article>' if article_node else 'highest score'
 
                 if best_candidate:
+                    # the tree is about to change, its index is no use to the conservative pass any more
+                    if profile is None:
+                        forget_ruthless_copy()
+                    if trace is not None:
+                        trace.record('best', best_candidate.elem, score=best_candidate.content_score, reason=reason)
+                    # where it is has to be taken before get_article moves it
+                    learned = path_of(best_candidate.elem) if self.profiles is not None and profile is None else None
                     # TODO: there was some logic here about retrying if the article wasn't long enough
-                    return utils.sanitize(utils.get_article(candidates, best_candidate), candidates)
+                    article = utils.get_article(candidates, best_candidate, index)
+                    clock.lap('get_article', article)
+                    article = utils.sanitize(article, candidates, index=index, trace=trace)
+                    clock.lap('sanitize', article)
+                    if learned is not None or profile is not None:
+                        long_enough = utils.text_length(article, index) >= self.min_article_length
+                        if learned is not None and long_enough:
+                            self.profiles.learn(self.url, learned, ruthless, article_node is not None)
+                        elif profile is not None and not long_enough:
+                            article = None
                 else:
-                    return None
+                    article = None
+                if trace is not None:
+                    trace.record('result', found=article is not None)
+                return article
             except StandardError, e:
                 log.exception('error getting summary: ')
                 raise Unparseable(str(e)), None, sys.exc_info()[2]
 
         # Make 2 attempts to parse an article. First, try ruthlessly: aggressively removing things that are likely
-        # not part of the article. If that fails to find a valid article, try in a more conservative way
+        # not part of the article. If that fails to find a valid article, try in a more conservative way.
+        # The unlikely candidates are only recorded here, the original tree is left alone. The conservative attempt
+        # only differs from the ruthless one by their text: if there isn't any (or there are no unlikely candidates)
+        # it would find nothing either and is skipped. Both are only made if the site's profile doesn't fit the page.
+        if trace is not None:
+            trace.record('document', url=self.url, page=self.page)
+        clock = StageClock(self.timer)
+        start = clock.start
+        unlikely = utils.find_unlikely_candidates(self.html, trace)
+        clock.lap('find_unlikely', self.html)
+        # the nodes of the ruthless copy and, as long as its tree is only scored, its index; in low memory mode they
+        # aren't kept for the conservative pass, which copies the whole page again instead
+        pruned_nodes = [] if unlikely and not self.low_memory else None
+        ruthless_pass = {}
         article = None
-        try:
-            article = do_parse(True)
-        except Unparseable:
-            pass
+        profile = self.profiles.get(self.url) if self.profiles is not None else None
+        if profile is not None:
+            try:
+                article = do_parse(profile['ruthless'], profile)
+            except Unparseable:
+                sys.exc_clear()
+            self.profiles.used(self.url, article is not None)
+            if article is not None:
+                self.parsed_by = 'profile'
+            else:
+                log.info('the site profile doesn\'t fit the page')
         if article is None:
-            log.info('ruthless parsing didn\'t work')
-            article = do_parse(False)
+            retry = bool(unlikely)
+            try:
+                article = do_parse(True)
+            except Unparseable:
+                if not unlikely:
+                    raise
+                forget_ruthless_copy()
+                # the traceback keeps the ruthless attempt's tree alive, let it go before making another copy
+                sys.exc_clear()
+            else:
+                retry = retry and any(elem.text_content() for elem in unlikely)
+            if article is not None:
+                self.parsed_by = 'ruthless'
+            elif retry:
+                log.info('ruthless parsing didn\'t work')
+                article = do_parse(False)
+                if article is not None:
+                    self.parsed_by = 'conservative'
+        clock.start = start
+        clock.lap('parsed_by_' + self.parsed_by if self.parsed_by else 'no_article', article)
         return article
 
     def debug(self, *a):
         log.debug(*a)
 
 
-def get_article(url, text=None):
+def get_article(url, text=None, fetcher=None, prefetch=True, content_type=None, trace=None, timer=None,
+                prefilter=None, low_memory=False, max_size=None, max_nodes=None, stream=False, profiles=None):
     """
     Given a URL this loads the page and parses the article, attempting to page it as well.
 
     :param url: url to find an article on
+    :param text: optionally the string value of the first page
+    :param fetcher: Fetcher used for all pages, defaults to a shared one
+    :param prefetch: start fetching the next page while the current one is being parsed
+    :param content_type: Content-Type header text was served with
+    :param trace: Trace to record the scoring decisions made on every page in
+    :param timer: called with the stages of the work on every page, see Document, and for waiting on the pages
+        after the first (fetch), removing the boilerplate and serializing the article
+    :param prefilter: Prefilter for the first page, see Document
+    :param low_memory: see Document, for every page
+    :param max_size: see Document, for every page
+    :param max_nodes: see Document, for every page
+    :param stream: parse the first page as it downloads, see Document; the next ones are prefetched
+    :param profiles: SiteProfiles, see Document, for every page
     """
-    doc = Document(url, text)
+    fetcher = fetcher or default_fetcher()
+    limits = dict(low_memory=low_memory, max_size=max_size, max_nodes=max_nodes)
+    doc = Document(url, text, fetcher=fetcher, content_type=content_type, trace=trace, timer=timer,
+                   prefilter=prefilter, stream=stream, profiles=profiles, **limits)
+    # pages that aren't articles are turned down before their next page is looked for or fetched
     if not doc.is_article:
         raise NotArticle()
+    # the first page has been parsed and accepted by now, so its next page only starts downloading here; the pages
+    # after it have their next page prefetched before they are parsed
+    nexturl = doc.get_next_page_url()
+    pending = fetcher.prefetch(nexturl) if prefetch and nexturl and nexturl != url else None
 
     pages = []
-    used_urls = set(url)
+    used_urls = set([url])
     current = doc
     # if we find an article see if we can find more pages
-    nexturl = current.get_next_page_url()
     while nexturl and nexturl not in used_urls:
-        log.info('fetching page %d at url: %s' % (current.page + 1, nexturl))
-        nextdoc = Document(nexturl, page=current.page + 1)
-        if nextdoc.article is not None:
-            used_urls.add(nexturl)
-            pages.append(nextdoc.article)
-            nexturl = nextdoc.get_next_page_url()
-            current = nextdoc
-    log.info('found %d more pages' % len(pages))
+        used_urls.add(nexturl)
+        log.info('fetching page %d at url: %s', current.page + 1, nexturl)
+        clock = StageClock(timer)
+        try:
+            if pending is not None and pending.url == nexturl:
+                nexttext, nexttype = pending.result()
+            else:
+                nexttext, nexttype = fetcher.fetch_raw(nexturl)
+        except requests.RequestException:
+            log.exception('could not fetch page %d at url: %s', current.page + 1, nexturl)
+            break
+        clock.lap('fetch')
+        nextdoc = Document(nexturl, nexttext, page=current.page + 1, fetcher=fetcher, content_type=nexttype,
+                           trace=trace, timer=timer, profiles=profiles, **limits)
+        followurl = nextdoc.get_next_page_url()
+        pending = None
+        if prefetch and followurl and followurl not in used_urls:
+            pending = fetcher.prefetch(followurl)
+        if nextdoc.article is None:
+            break
+        pages.append(nextdoc.article)
+        nexturl = followurl
+        current = nextdoc
+    log.info('found %d more pages', len(pages))
     # append any additional pages to the first one's content
     for page in pages:
         doc.article.append(page)
     # now clean it up, removing any boilerplate that may be on each page of the article
+    clock = StageClock(timer)
     utils.remove_boilerplate(doc.article, len(pages) + 1)
-    return doc.get_clean_article()
+    clock.lap('remove_boilerplate', doc.article)
+    article = doc.get_clean_article()
+    clock.lap('serialize')
+    return article
 
 
 def main():
     from optparse import OptionParser
+    from cache import ArticleCache, SqliteCache
+    import corpus
     parser = OptionParser(usage="%prog: [options] [file]")
     parser.add_option('-v', '--verbose', action='store_true')
     parser.add_option('-u', '--url', default=None, help="use URL instead of a local file")
     parser.add_option('-p', '--positive-keywords', default=None, help="positive keywords (separated with comma)", action='store')
     parser.add_option('-n', '--negative-keywords', default=None, help="negative keywords (separated with comma)", action='store')
+    parser.add_option('-b', '--bulk', default=None, choices=sorted(corpus.READERS), help="read jsonl or warc records of url and html from the file (or stdin) and write the articles to stdout as json lines")
+    parser.add_option('-j', '--jobs', type='int', default=None, help="number of worker processes for --bulk, defaults to the number of CPUs")
+    parser.add_option('-c', '--cache', default=None, help="sqlite file to keep the articles of --bulk in, pages seen before aren't parsed again")
+    parser.add_option('-t', '--trace', default=None, help="write the scoring decisions to this file as json lines")
+    parser.add_option('--low-memory', action='store_true', help="parse in less memory, for very large pages")
+    parser.add_option('--max-nodes', type='int', default=None, help="parse only the first MAX_NODES nodes of each page")
     (options, args) = parser.parse_args()
 
+    logging.basicConfig(level=logging.INFO)
+    # only those given, the others would be part of the cache keys
+    limits = {}
+    if options.low_memory:
+        limits['low_memory'] = True
+    if options.max_nodes:
+        limits['max_nodes'] = options.max_nodes
+
+    if options.bulk:
+        log.setLevel(logging.DEBUG if options.verbose else logging.WARNING)
+        if args and args[0] != '-':
+            records = open(args[0], 'rb')
+        else:
+            records = sys.stdin
+        cache = ArticleCache(SqliteCache(options.cache)) if options.cache else None
+        summary = corpus.extract_corpus(corpus.READERS[options.bulk](records), sys.stdout, processes=options.jobs,
+                                        cache=cache, **limits)
+        sys.stderr.write(corpus.format_summary(summary) + '\n')
+        return
+
     if not (len(args) == 1 or options.url):
         parser.print_help()
         sys.exit(1)
@@ -236,8 +561,12 @@ def main():
         with open(args[0], 'rt') as f:
             content = f.read()
 
+    trace = Trace() if options.trace else None
     enc = sys.__stdout__.encoding or 'utf-8' # XXX: this hack could not always work, better to set PYTHONIOENCODING
-    print Document(options.url, content).get_clean_article().encode(enc, 'replace')
+    print Document(options.url, content, trace=trace, **limits).get_clean_article().encode(enc, 'replace')
+    if trace is not None:
+        with open(options.trace, 'wb') as f:
+            trace.write(f)
 
 
 if __name__ == '__main__':
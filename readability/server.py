@@ -1,21 +1,251 @@
-from flask import Flask, request
-from readability import get_article, NotArticle
+import hashlib
+import logging
+import sys
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
-app = Flask('readability')
+import requests
+from flask import Flask, request, abort, jsonify
 
+import encoding
+import utils
+from cache import LRUCache
+from fetch import Fetcher
+from prefilter import default_prefilter
+from profiles import SiteProfiles
+from readability import get_article, NotArticle, Unparseable
 
-@app.route('/')
-def readerize():
-    if not request.args.get('url'):
-        raise ValueError()
 
-    try:
+class Overloaded(Exception):
+    pass
+
+
+class PendingArticle(object):
+    """
+    An extraction that requests for the same url wait on together.
+
+    The pool's own AsyncResult can't be shared like that, it only wakes up one of the threads waiting on it.
+    """
+
+    def __init__(self):
+        self.article = None
+        self.error = None
+        self._done = threading.Event()
+
+    def set(self, article=None, error=None):
+        self.article = article
+        self.error = error
+        self._done.set()
+
+    def get(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.article
+
+
+class ArticleService(object):
+    """
+    Extracts articles for the web service in a bounded pool of worker threads.
+
+    Concurrent requests for the same URL share a single extraction. Articles are cached by URL and a hash of the
+    page content: within ttl seconds a URL is answered from the cache without fetching it, after that the page is
+    fetched again and only extracted if its content changed.
+    """
+
+    def __init__(self, workers=4, max_pending=64, cache_size=1000, ttl=300, timeout=30, fetcher=None,
+                 prefilter=None, profiles=None):
+        """
+        :param workers: number of extractions running at once
+        :param max_pending: requests waiting for an article beyond this are turned away, those sharing an
+            extraction included
+        :param cache_size: number of articles to keep
+        :param ttl: seconds a URL is served from the cache without looking at the page again
+        :param timeout: seconds a request waits for its article
+        :param fetcher: Fetcher for the upstream pages
+        :param prefilter: Prefilter turning down pages that clearly aren't articles, see Document
+        :param profiles: SiteProfiles to parse the pages of the sites seen before around their articles, see Document
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.fetcher = fetcher or Fetcher()
+        self.prefilter = prefilter or default_prefilter()
+        self.profiles = profiles
+        # url -> hash of the page content, and (url, hash) -> article (None if it wasn't an article)
+        self.hashes = LRUCache(cache_size, ttl)
+        self.articles = LRUCache(cache_size)
+        self.counts = dict.fromkeys(['requests', 'cache_hits', 'revalidated', 'extracted', 'deduplicated',
+                                     'not_article', 'errors', 'overloaded', 'timeouts'], 0)
+        self.extract_seconds = 0.0
+        self._pool = None
+        self._pending = {}
+        # requests waiting on the extractions in _pending
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def cached(self, url):
+        content_hash = self.hashes.get(url)
+        if content_hash is None:
+            return False, None
+        key = url, content_hash
+        article = self.articles.get(key, self)
+        if article is self:
+            return False, None
+        return True, article
+
+    def article(self, url):
+        """
+        Returns the clean article at url, or None if the page isn't an article.
+        """
+        self.count('requests')
+        found, article = self.cached(url)
+        if found:
+            self.count('cache_hits')
+            return article
+
+        pool = self.pool
+        with self._lock:
+            if self._waiting >= self.max_pending:
+                self.counts['overloaded'] += 1
+                raise Overloaded()
+            self._waiting += 1
+            pending = self._pending.get(url)
+            if pending is not None:
+                self.counts['deduplicated'] += 1
+            else:
+                pending = self._pending[url] = PendingArticle()
+                pool.apply_async(self.run, (url, pending))
+        try:
+            return pending.get(self.timeout)
+        except TimeoutError:
+            self.count('timeouts')
+            raise
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def run(self, url, pending):
+        try:
+            pending.set(self.extract(url))
+        except Exception:
+            self.count('errors')
+            pending.set(error=sys.exc_info())
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def extract(self, url):
+        text, content_type = self.fetcher.fetch_raw(url)
+        content_hash = hashlib.sha1(text).hexdigest()
+        key = url, content_hash
+        article = self.articles.get(key, self)
+        if article is not self:
+            self.count('revalidated')
+        else:
+            start = time.time()
+            try:
+                article = get_article(url, text, fetcher=self.fetcher, content_type=content_type,
+                                      prefilter=self.prefilter, profiles=self.profiles)
+            except NotArticle:
+                self.count('not_article')
+                article = None
+            with self._lock:
+                self.counts['extracted'] += 1
+                self.extract_seconds += time.time() - start
+            self.articles.set(key, article)
+        self.hashes.set(url, content_hash)
+        return article
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self.counts)
+            metrics['pending'] = len(self._pending)
+            metrics['waiting'] = self._waiting
+            metrics['workers'] = self.workers
+            metrics['extract_seconds'] = self.extract_seconds
+        metrics['cache'] = self.articles.stats()
+        metrics['cache']['urls'] = len(self.hashes)
+        metrics['prefilter'] = self.prefilter.stats()
+        metrics['features'] = utils.feature_cache.stats()
+        # how many pages each strategy found the encoding of, in this process
+        metrics['encoding'] = dict(encoding.strategies)
+        if self.profiles is not None:
+            metrics['profiles'] = self.profiles.stats()
+        return metrics
+
+
+def create_app(service=None):
+    app = Flask('readability')
+    app.service = service or ArticleService()
+
+    @app.route('/')
+    def readerize():
+        url = request.args.get('url')
+        if not url:
+            abort(400)
+        try:
+            article = app.service.article(url)
+        except Overloaded:
+            abort(503)
+        except TimeoutError:
+            abort(504)
+        except (Unparseable, requests.RequestException):
+            abort(502)
+        if article is None:
+            return 'not article'
         return '<html><head><link rel="stylesheet" type="text/css" href="/static/style.css"></head><body>' + \
-               get_article(request.args.get('url')) + "</body></html>"
-    except NotArticle:
-        return 'not article'
+               article + "</body></html>"
 
+    @app.route('/health')
+    def health():
+        return jsonify(status='ok')
 
-if __name__ == '__main__':
-    app.run(port=8040, debug=True)
+    @app.route('/metrics')
+    def metrics():
+        return jsonify(**app.service.metrics())
+
+    return app
 
+
+app = create_app()
+
+
+def main():
+    from optparse import OptionParser
+    parser = OptionParser(usage="%prog: [options]")
+    parser.add_option('--port', type='int', default=8040)
+    parser.add_option('--workers', type='int', default=4, help="number of articles extracted at once")
+    parser.add_option('--cache-size', type='int', default=1000, help="number of articles to cache")
+    parser.add_option('--ttl', type='int', default=300, help="seconds to serve a url from the cache before checking the page again")
+    parser.add_option('--profiles', default=None, help="json file to keep the site profiles in, read at start and written on exit")
+    parser.add_option('--debug', action='store_true')
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    profiles = SiteProfiles(options.profiles) if options.profiles else None
+    service = ArticleService(workers=options.workers, cache_size=options.cache_size, ttl=options.ttl,
+                             profiles=profiles)
+    try:
+        create_app(service).run(port=options.port, debug=options.debug, threaded=True)
+    finally:
+        if profiles is not None:
+            profiles.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# recording the decisions made while finding an article and how long it took, to look at them offline
+import json
+import time
+from collections import OrderedDict
+
+from utils import describe
+
+
+class Trace(object):
+    """
+    Records the scoring decisions made while parsing documents, as dicts rather than log lines.
+
+    Every event has an 'event' key naming it. Events about an element also have its description ('node') and its
+    xpath in the tree being worked on ('path'). The events are, in the order they happen:
+
+    - rejected: the prefilter turned the page down, it isn't parsed and none of the events below follow (reason)
+    - document: a document is being parsed (url, page)
+    - unlikely: an element that the ruthless pass leaves out
+    - profile: a pass around the element the site's profile points to starts, before the others (ruthless, article)
+    - pass: a pass over the document starts (ruthless)
+    - candidate: the final score of a candidate (score, link_density, final_score)
+    - best: the element the article is built around (score, reason)
+    - cleaned: an element removed from the article (score, weight, reason)
+    - allowed: an element kept in the article although it would have been cleaned (reason, siblings_length)
+    - result: the outcome of a pass (found)
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def record(self, event, elem=None, **fields):
+        fields['event'] = event
+        if elem is not None:
+            fields['node'] = describe(elem)
+            fields['path'] = elem.getroottree().getpath(elem)
+        self.events.append(fields)
+
+    def write(self, stream):
+        """
+        Writes the events to stream as JSON lines.
+        """
+        for event in self.events:
+            stream.write(json.dumps(event) + '\n')
+
+
+def count_nodes(tree):
+    return sum(1 for _ in tree.iter())
+
+
+class StageClock(object):
+    """
+    Times consecutive stages of work and reports each one to a timer, doing nothing if there is no timer.
+
+    The timer is called with the name of the stage, the seconds it took and the number of nodes in the tree it
+    left behind (None for stages without a tree, like fetching).
+    """
+
+    def __init__(self, timer, prefix=''):
+        self.timer = timer
+        self.prefix = prefix
+        self.start = time.time()
+
+    def lap(self, stage, tree=None):
+        if self.timer is None:
+            return
+        seconds = time.time() - self.start
+        self.timer(self.prefix + stage, seconds, None if tree is None else count_nodes(tree))
+        # counting the nodes isn't part of the next stage
+        self.start = time.time()
+
+
+class Timings(object):
+    """
+    A timer for Document and get_article that adds up the calls, seconds and nodes of every stage.
+
+    The stages of a document are fetch (if it downloads the page) and build_doc, or stream instead of both when it
+    parses the page as it downloads, then clean, truncate (with max_nodes) and make_links_absolute. is_article times
+    prefilter. Parsing times find_unlikely, then for each pass (prefixed with 'profile:', 'ruthless:' or
+    'conservative:') copy, transform_divs, index, score_paragraphs, get_article and sanitize, and ends with
+    parsed_by_profile, parsed_by_ruthless, parsed_by_conservative or no_article, timing the whole parse and counting
+    the nodes of the article. get_article adds a fetch for each further page it downloads, then remove_boilerplate
+    and serialize.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def __call__(self, stage, seconds, nodes):
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {'calls': 0, 'seconds': 0.0, 'nodes': 0}
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        if nodes is not None:
+            entry['nodes'] += nodes
+
+    def total(self):
+        """
+        Returns the seconds spent in the stages, leaving out the whole-parse stages that overlap them.
+        """
+        return sum(entry['seconds'] for stage, entry in self.stages.iteritems()
+                   if not stage.startswith('parsed_by_') and stage != 'no_article')
@@ -1,12 +1,19 @@
+import hashlib
 import logging
 
+from collections import defaultdict
+from copy import deepcopy
+from itertools import izip
 from urlparse import urlparse
 
+from lxml import etree
 from lxml.etree import tostring
 
 import re
 from lxml.html import fragment_fromstring
 
+from cleaners import normalize_spaces
+
 
 REGEXES = {
     'unlikelyCandidatesRe': re.compile('combx|comment|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter|sociable|social', re.I),
@@ -23,35 +30,389 @@ REGEXES = {
     #skipFootnoteLink:      /^\s*(\[?[a-z0-9]{1,2}\]?|^|edit|citation needed)\s*$/i,
 }
 
+# tag of the stand-ins pruned_copy puts in place of the elements it leaves out
+PLACEHOLDER = 'readability-placeholder'
+
+log = logging.getLogger()
+
 
 def tags(node, *tag_names):
     """
-    Iterates through all descendants of node with any of the tag names.
+    Iterates through all descendants of node with any of the tag names: those with the first name in document order,
+    then those with the second and so on.
+
+    The tree is walked once for all the names. Just like with a findall('.//name') made when it is the name's turn,
+    elements that were removed from the tree while going through the earlier names are left out.
 
     :param node: lxml element
     :param tag_names: strings
     """
-    for tag_name in tag_names:
-        for e in node.findall('.//%s' % tag_name):
-            yield e
+    return _tags_by_name(node, tag_names, False)
 
 
 def reverse_tags(node, *tag_names):
     """
-    Iterates in reverse order through all descendants of node with any of the tag names.
+    Iterates in reverse order through all descendants of node with any of the tag names, name by name like tags.
 
     :param node: lxml element
     :param tag_names: strings
     """
-    for tag_name in tag_names:
-        for e in reversed(node.findall('.//%s' % tag_name)):
+    return _tags_by_name(node, tag_names, True)
+
+
+def _tags_by_name(node, tag_names, reverse):
+    found = dict((name, []) for name in tag_names)
+    for e in node.iterdescendants(*tag_names):
+        found[e.tag].append(e)
+    for i, name in enumerate(tag_names):
+        elements = found[name]
+        if i:
+            elements = still_inside(elements, node)
+        if reverse:
+            elements = reversed(elements)
+        for e in elements:
             yield e
 
 
+def still_inside(elements, node):
+    """
+    Returns the elements that are still descendants of node, e.g. after some of their ancestors were dropped.
+
+    Each ancestor is looked at once, however many of the elements it holds.
+    """
+    inside = {node: True}
+    kept = []
+    for elem in elements:
+        path = []
+        parent = elem.getparent()
+        while parent is not None and parent not in inside:
+            path.append(parent)
+            parent = parent.getparent()
+        found = parent is not None and inside[parent]
+        for ancestor in path:
+            inside[ancestor] = found
+        if found:
+            kept.append(elem)
+    return kept
+
+
+class TagCounts(object):
+    """
+    The number of descendants with each of a few tag names for the elements of a tree, added up from the bottom of
+    the tree in one pass rather than counted with a findall per element and name.
+
+    Nodes must be removed through drop_tree so the counts of their ancestors stay right.
+    """
+
+    def __init__(self, root, names):
+        """
+        :param root: lxml element, the counts are kept for it and its descendants
+        :param names: the tag names to count
+        """
+        self.root = root
+        self.names = names
+        self._slots = dict((name, slot) for slot, name in enumerate(names))
+        self._counts = all_counts = {}
+        slots = self._slots
+        # children come before their parents in reverse document order
+        for elem in reversed(list(root.iter())):
+            if elem is root:
+                break
+            counts = all_counts.get(elem)
+            slot = slots.get(elem.tag)
+            if counts is None and slot is None:
+                continue
+            parent = elem.getparent()
+            parent_counts = all_counts.get(parent)
+            if parent_counts is None:
+                parent_counts = all_counts[parent] = [0] * len(names)
+            if counts is not None:
+                for i, count in enumerate(counts):
+                    parent_counts[i] += count
+            if slot is not None:
+                parent_counts[slot] += 1
+
+    def _add(self, elem, counts, sign=1):
+        # adds counts, or takes them away, from every ancestor of elem up to the root
+        root = self.root
+        all_counts = self._counts
+        parent = elem.getparent()
+        while parent is not None:
+            mine = all_counts.get(parent)
+            if mine is None:
+                mine = all_counts[parent] = [0] * len(counts)
+            for slot, count in enumerate(counts):
+                mine[slot] += sign * count
+            if parent is root:
+                break
+            parent = parent.getparent()
+
+    def get(self, elem):
+        """
+        Returns a dict of tag name to the number of descendants of elem with it.
+        """
+        return dict(zip(self.names, self._counts.get(elem) or [0] * len(self.names)))
+
+    def drop_tree(self, elem, index=None):
+        """
+        Removes elem like lxml's drop_tree, or the index's if one is given, and updates the counts of its ancestors.
+        """
+        removed = list(self._counts.get(elem) or [0] * len(self.names))
+        if elem.tag in self._slots:
+            removed[self._slots[elem.tag]] += 1
+        self._add(elem, removed, -1)
+        if index is not None:
+            index.drop_tree(elem)
+        else:
+            elem.drop_tree()
+
+
+newlinesRe = re.compile('\s*\n\s*')
+spacesRe = re.compile('[ \t]{2,}')
+
+
+def squeeze(text):
+    """
+    Collapses runs of whitespace the way clean does, without stripping the ends.
+    """
+    if '\n' in text:
+        text = newlinesRe.sub('\n', text)
+    if '\t' in text or '  ' in text:
+        text = spacesRe.sub(' ', text)
+    return text
+
+
 def clean(text):
-    text = re.sub('\s*\n\s*', '\n', text)
-    text = re.sub('[ \t]{2,}', ' ', text)
-    return text.strip()
+    return squeeze(text).strip()
+
+
+# Text spans are (leading whitespace, cleaned length, trailing whitespace) triples describing a piece of text. If the
+# text is all whitespace the length is None and the leading part holds all of it. Spans can be joined without going
+# back to the text, which is what allows TextIndex to compute clean() lengths bottom up.
+EMPTY_SPAN = ('', None, '')
+
+
+def text_span(text):
+    if not text:
+        return EMPTY_SPAN
+    stripped = text.lstrip()
+    if not stripped:
+        return (text, None, '')
+    core = stripped.rstrip()
+    return (text[:len(text) - len(stripped)], len(squeeze(core)), stripped[len(core):])
+
+
+# the same indentation whitespace shows up between nodes over and over
+_gap_lengths = {}
+
+
+def gap_length(gap):
+    try:
+        return _gap_lengths[gap]
+    except KeyError:
+        length = len(squeeze(gap))
+        if len(_gap_lengths) < 1024:
+            _gap_lengths[gap] = length
+        return length
+
+
+def join_spans(first, second):
+    if first[1] is None:
+        return (first[0] + second[0], second[1], second[2])
+    if second[1] is None:
+        return (first[0], first[1], first[2] + second[0])
+    gap = first[2] + second[0]
+    length = first[1] + second[1]
+    if len(gap) == 1:
+        length += 1
+    elif gap:
+        length += gap_length(gap)
+    return (first[0], length, second[2])
+
+
+class TextIndex(object):
+    """
+    Text statistics for every element of a tree, computed in a single bottom-up walk.
+
+    For each element it keeps the length of its cleaned text content (what text_length returns), the summed text
+    length of the links inside it and the number of commas in it, so scoring does not have to call text_content()
+    on every nested subtree. Nodes must be removed through drop_tree so the ancestors stay up to date; elements
+    that are not in the index yet (e.g. a freshly created article container) are indexed on first use.
+    """
+
+    def __init__(self, root, known=None, keep_pieces=True):
+        """
+        :param root: the element to index
+        :param known: statistics of elements of root that are already known, see shared_with, the index takes the
+            dict over
+        :param keep_pieces: keep the spans of every element's text and tails, without them the index takes about
+            half the memory but refreshing the ancestors after a drop has to look at their text again
+        """
+        self._stats = known if known is not None else {}
+        # spans of each element's own text and of its children's tails, so refreshing an ancestor after a drop
+        # doesn't have to look at its text again
+        self._pieces = {}
+        self._keep_pieces = keep_pieces
+        self.add(root)
+
+    def add(self, root):
+        """
+        Indexes every element of the subtree that isn't indexed yet.
+        """
+        stats = self._stats
+        for elem in reversed(list(root.iter(tag=etree.Element))):
+            if elem not in stats:
+                stats[elem] = self._compute(elem)
+
+    def _compute(self, elem, fresh=True):
+        stats = self._stats
+        pieces = None if fresh else self._pieces.get(elem)
+        if pieces is None:
+            direct_commas = elem.text.count(',') if elem.text else 0
+            tails = []
+            for child in elem:
+                if child.tail:
+                    tails.append(text_span(child.tail))
+                    direct_commas += child.tail.count(',')
+                else:
+                    tails.append(EMPTY_SPAN)
+            pieces = text_span(elem.text), tails, direct_commas
+            if self._keep_pieces:
+                self._pieces[elem] = pieces
+        span, tails, commas = pieces
+        links = 0
+        for child, tail in izip(elem, tails):
+            if isinstance(child.tag, basestring):
+                if child not in stats:
+                    self.add(child)
+                child_span, child_commas, child_links = stats[child]
+                span = join_spans(span, child_span)
+                commas += child_commas
+                links += child_links
+                if child.tag == 'a':
+                    links += child_span[1] or 0
+            if tail is not EMPTY_SPAN:
+                span = join_spans(span, tail)
+        return span, commas, links
+
+    def shared_with(self, pairs):
+        """
+        Returns the statistics of this index for the elements of another tree, to start that tree's index with.
+
+        :param pairs: (element of the other tree, element of this one) pairs, for elements whose text is the same
+        """
+        stats = self._stats
+        return dict((other, stats[elem]) for other, elem in pairs if elem in stats)
+
+    def _get(self, elem):
+        if elem not in self._stats:
+            self.add(elem)
+        return self._stats[elem]
+
+    def text_length(self, elem):
+        return self._get(elem)[0][1] or 0
+
+    def comma_count(self, elem):
+        return self._get(elem)[1]
+
+    def link_length(self, elem):
+        return self._get(elem)[2]
+
+    def link_density(self, elem):
+        span, commas, links = self._get(elem)
+        return float(links) / max(span[1] or 0, 1)
+
+    def columns(self, elems):
+        """
+        Returns the text lengths, comma counts and link lengths of elems as three lists.
+        """
+        stats = self._stats
+        rows = [stats[elem] if elem in stats else self._get(elem) for elem in elems]
+        return [span[1] or 0 for span, commas, links in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+    def refresh(self, elem):
+        """
+        Recomputes the statistics of elem and all of its ancestors after its children changed.
+        """
+        self._stats[elem] = self._compute(elem)
+        elem = elem.getparent()
+        while elem is not None:
+            self._stats[elem] = self._compute(elem, fresh=False)
+            elem = elem.getparent()
+
+    def drop_tree(self, elem):
+        """
+        Removes elem (keeping its tail, like lxml's drop_tree) and updates its ancestors.
+        """
+        parent = elem.getparent()
+        elem.drop_tree()
+        self.refresh(parent)
+
+
+class FeatureCache(object):
+    """
+    Remembers what the regexes make of class and id strings, which sites repeat on many elements of every page, so
+    they only run once for each string.
+
+    It holds at most max_entries strings for the weights and as many for the unlikely verdicts; when one of them is
+    full it is emptied, which is cheaper than keeping track of the least recently used strings on every lookup. The
+    counters aren't locked, under threads they may miss a few lookups. Clear it after changing REGEXES.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._weights = {}
+        self._unlikely = {}
+
+    def _remember(self, entries, key, value):
+        self.misses += 1
+        if len(entries) >= self.max_entries:
+            entries.clear()
+        entries[key] = value
+        return value
+
+    def weight(self, feature):
+        """
+        Returns what a class or id adds to the score of its element.
+        """
+        weight = self._weights.get(feature)
+        if weight is not None:
+            self.hits += 1
+            return weight
+        weight = 0
+        if REGEXES['negativeRe'].search(feature):
+            weight -= 25
+        if REGEXES['positiveRe'].search(feature):
+            weight += 25
+        return self._remember(self._weights, feature, weight)
+
+    def unlikely(self, features):
+        """
+        Returns True if the class and id of an element, joined by a space, suggest it isn't part of the article.
+        """
+        verdict = self._unlikely.get(features)
+        if verdict is not None:
+            self.hits += 1
+            return verdict
+        verdict = bool(REGEXES['unlikelyCandidatesRe'].search(features)
+                       and not REGEXES['okMaybeItsACandidateRe'].search(features))
+        return self._remember(self._unlikely, features, verdict)
+
+    def clear(self):
+        self._weights.clear()
+        self._unlikely.clear()
+
+    def __len__(self):
+        return len(self._weights) + len(self._unlikely)
+
+    def stats(self):
+        return {'entries': len(self), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+# shared by all the documents of the process, set its max_entries to change its size
+feature_cache = FeatureCache()
 
 
 def class_weight(e):
@@ -61,19 +422,42 @@ def class_weight(e):
     weight = 0
     for feature in [e.get('class', None), e.get('id', None)]:
         if feature:
-            if REGEXES['negativeRe'].search(feature):
-                weight -= 25
-
-            if REGEXES['positiveRe'].search(feature):
-                weight += 25
+            weight += feature_cache.weight(feature)
     return weight
 
 
-def score_node(elem, score_text_length=False):
+class Candidate(object):
+    """
+    An element that may hold the article, with its content score.
+
+    Pages can have thousands of them, so they are slotted rather than the dicts they used to be; candidate['elem']
+    and candidate['content_score'] still work as they did.
+    """
+    __slots__ = ('elem', 'content_score')
+
+    def __init__(self, elem, content_score=0):
+        self.elem = elem
+        self.content_score = content_score
+
+    def __getitem__(self, key):
+        if key not in Candidate.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in Candidate.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return 'Candidate(%s, %r)' % (describe(self.elem, 0), self.content_score)
+
+
+def score_node(elem, score_text_length=False, index=None):
     """
     Scores the element based on the type of HTML tag and its class.
 
-    :returns: a dict containing 'content_score' and 'elem' keys.
+    :returns: a Candidate for elem
     """
     content_score = class_weight(elem)
     name = elem.tag.lower()
@@ -89,28 +473,26 @@ def score_node(elem, score_text_length=False):
         content_score -= 5
 
     if score_text_length:
-        inner_text = clean(elem.text_content() or "")
-        inner_text_len = len(inner_text)
+        if index is None:
+            index = TextIndex(elem)
+        inner_text_len = index.text_length(elem)
 
         # If this section is less than 200 characters
         # don't even count it.
         if inner_text_len < 200:
             content_score = 0
         else:
-            content_score += len(inner_text.split(','))
+            content_score += index.comma_count(elem) + 1
             content_score += min((inner_text_len / 100), 3)
 
-    return {
-        'content_score': content_score,
-        'elem': elem
-    }
+    return Candidate(elem, content_score)
 
 
-def get_article_element(html):
+def get_article_element(html, index=None):
     """
     Returns an article candidate if there is a definitive article.
     """
-    articles = [art for art in [score_node(art, True) for art in tags(html, 'article')] if art['content_score'] > 0]
+    articles = [art for art in [score_node(art, True, index) for art in tags(html, 'article')] if art.content_score > 0]
     if len(articles) == 1:
         return articles[0]
     else:
@@ -132,12 +514,16 @@ def describe(node, depth=1):
     return name
 
 
-def score_paragraphs(html, min_len=25):
+def score_paragraphs(html, min_len=25, index=None, trace=None):
     """
     Scores each paragraph in the document except for those that are less than min length.
 
-    :returns: a dict of candidate element to a dict containing 'content_score' and 'elem' keys.
+    :param index: TextIndex of html, built here if not given
+    :param trace: Trace to record the final score of each candidate in
+    :returns: a dict of candidate element to its Candidate
     """
+    if index is None:
+        index = TextIndex(html)
     # minimum length to be considered as a valid paragraph (in number of characters)
     candidates = {}  # dict mapping the candidate node to its score
     ordered = []
@@ -147,8 +533,7 @@ def score_paragraphs(html, min_len=25):
             continue
         grand_parent_node = parent_node.getparent()
 
-        inner_text = clean(elem.text_content() or "")
-        inner_text_len = len(inner_text)
+        inner_text_len = index.text_length(elem)
 
         # If this paragraph is less than 25 characters
         # don't even count it.
@@ -164,69 +549,186 @@ def score_paragraphs(html, min_len=25):
             ordered.append(grand_parent_node)
 
         content_score = 1
-        content_score += len(inner_text.split(','))
+        content_score += index.comma_count(elem) + 1
         content_score += min((inner_text_len / 100), 3)
         #if elem not in candidates:
         #    candidates[elem] = self.score_node(elem)
 
         #WTF? candidates[elem]['content_score'] += content_score
-        candidates[parent_node]['content_score'] += content_score
+        candidates[parent_node].content_score += content_score
         if grand_parent_node is not None:
-            candidates[grand_parent_node]['content_score'] += content_score / 2.0
+            candidates[grand_parent_node].content_score += content_score / 2.0
 
     # Scale the final candidates score based on link density. Good content
     # should have a relatively small link density (5% or less) and be
     # mostly unaffected by this operation.
+    debug = log.isEnabledFor(logging.DEBUG)
     for elem in ordered:
         candidate = candidates[elem]
-        ld = get_link_density(elem)
-        score = candidate['content_score']
-        logging.debug("Candid: %6.3f %s link density %.3f -> %6.3f" % (
-            score,
-            describe(elem),
-            ld,
-            score * (1 - ld)))
-        candidate['content_score'] *= (1 - ld)
+        ld = index.link_density(elem)
+        score = candidate.content_score
+        if debug:
+            log.debug("Candid: %6.3f %s link density %.3f -> %6.3f", score, describe(elem), ld, score * (1 - ld))
+        if trace is not None:
+            trace.record('candidate', elem, score=score, link_density=ld, final_score=score * (1 - ld))
+        candidate.content_score *= (1 - ld)
 
     return candidates
 
 
+def is_unlikely_candidate(elem):
+    """
+    Returns True if the class and id of elem suggest it isn't part of the article.
+    """
+    s = "%s %s" % (elem.get('class', ''), elem.get('id', ''))
+    if len(s) < 2:
+        return False
+    return feature_cache.unlikely(s) and elem.tag not in ['html', 'body']
+
+
+def find_unlikely_candidates(html, trace=None):
+    """
+    Returns the elements remove_unlikely_candidates would drop, without changing the tree.
+
+    :param html: the html lxml document element
+    :param trace: Trace to record the elements in
+    """
+    found = []
+    for elem in html.iter():
+        if is_unlikely_candidate(elem):
+            found.append(elem)
+            if trace is not None:
+                trace.record('unlikely', elem)
+            if len(elem):
+                # remove_unlikely_candidates has always dropped nodes while iterating over the tree, which sends
+                # lxml's iterator into the detached subtree where it stops, so nothing after the first dropped node
+                # with children is removed. Keep doing exactly that.
+                break
+    return found
+
+
 def remove_unlikely_candidates(html):
     """
     Removes parts of the document that are unlikely to be part of the article.
 
     :param html: the html lxml document element
     """
-    for elem in html.iter():
-        s = "%s %s" % (elem.get('class', ''), elem.get('id', ''))
-        if len(s) < 2:
-            continue
-        if REGEXES['unlikelyCandidatesRe'].search(s) and (not REGEXES['okMaybeItsACandidateRe'].search(s)) and elem.tag not in ['html', 'body']:
-            logging.debug("Removing unlikely candidate - %s" % describe(elem))
-            elem.drop_tree()
+    debug = log.isEnabledFor(logging.DEBUG)
+    for elem in find_unlikely_candidates(html):
+        if debug:
+            log.debug("Removing unlikely candidate - %s", describe(elem))
+        elem.drop_tree()
     return html
 
 
+def _placeholder_copy(html, dropped):
+    """
+    Returns a deep copy of html with an empty placeholder, which carries the tail, in place of each dropped element.
+    """
+    swapped = []
+    for elem in dropped:
+        placeholder = elem.makeelement(PLACEHOLDER, {})
+        placeholder.tail = elem.tail
+        elem.getparent().replace(elem, placeholder)
+        swapped.append((elem, placeholder))
+    try:
+        return deepcopy(html)
+    finally:
+        for elem, placeholder in swapped:
+            placeholder.getparent().replace(placeholder, elem)
+
+
+def pruned_copy(html, dropped, nodes=None):
+    """
+    Returns a deep copy of html with the dropped elements removed as if by drop_tree, leaving html itself unchanged.
+
+    The dropped subtrees are never copied: each one is swapped for an empty placeholder (which carries its tail)
+    while the copy is made, and put back afterwards.
+
+    :param html: the lxml document element
+    :param dropped: elements of html to leave out, none of them inside another
+    :param nodes: optionally a list to fill with the elements of the copy in document order, the placeholders
+        included, to match them up with a restored_copy later
+    """
+    copied = _placeholder_copy(html, dropped)
+    if nodes is not None:
+        nodes.extend(copied.iter())
+    for placeholder in list(copied.iter(PLACEHOLDER)):
+        placeholder.drop_tree()
+    return copied
+
+
+def restored_copy(html, dropped, pruned_nodes):
+    """
+    Returns a deep copy of html, dropped elements and all, and the pairs of elements of the copy and of a pruned_copy
+    with the same dropped elements whose subtrees are the same in both copies, which is every element but the
+    dropped ones and their ancestors.
+
+    :param html: the lxml document element
+    :param dropped: the elements pruned_copy left out, in document order
+    :param pruned_nodes: the nodes pruned_copy filled
+    """
+    copied = _placeholder_copy(html, dropped)
+    placeholders = list(copied.iter(PLACEHOLDER))
+    changed = set()
+    for placeholder in placeholders:
+        parent = placeholder.getparent()
+        while parent is not None and parent not in changed:
+            changed.add(parent)
+            parent = parent.getparent()
+    same = [(mine, theirs) for mine, theirs in izip(copied.iter(), pruned_nodes)
+            if mine not in changed and mine.tag != PLACEHOLDER]
+    for placeholder, elem in izip(placeholders, dropped):
+        restored = deepcopy(elem)
+        restored.tail = placeholder.tail
+        placeholder.getparent().replace(placeholder, restored)
+    return copied, same
+
+
+def block_containers(html):
+    """
+    Returns the set of elements with a block-level element somewhere below them, in one walk over the tree.
+
+    A node counts as block-level when its serialized form would match divToPElementsRe, which is what
+    transform_misused_divs_into_paragraphs used to check on the serialized children of every <div>.
+
+    :param html: the lxml document element
+    """
+    containing = set()
+    is_block = {}
+    for node in html.iter():
+        tag = node.tag
+        if isinstance(tag, basestring):
+            if tag not in is_block:
+                is_block[tag] = REGEXES['divToPElementsRe'].match('<' + tag) is not None
+            block = is_block[tag]
+        else:
+            # comments and processing instructions are serialized as they are
+            block = REGEXES['divToPElementsRe'].search(tostring(node, with_tail=False)) is not None
+        if block:
+            parent = node.getparent()
+            while parent is not None and parent not in containing:
+                containing.add(parent)
+                parent = parent.getparent()
+    return containing
+
+
 def transform_misused_divs_into_paragraphs(html):
     """
     Transform <div>s that do not contain other block elements into <p>'s.
 
     :param html: the lxml document element
     """
+    containing = block_containers(html)
     for elem in tags(html, 'div'):
-        #FIXME: The current implementation ignores all descendants that
-        # are not direct children of elem
-        # This results in incorrect results in case there is an <img>
-        # buried within an <a> for example
-        if not REGEXES['divToPElementsRe'].search(
-                unicode(''.join(map(tostring, list(elem))))):
+        if elem not in containing:
             #self.debug("Altering %s to p" % (describe(elem)))
             elem.tag = "p"
             #print "Fixed element "+describe(elem)
 
     for elem in tags(html, 'div'):
         if elem.text and elem.text.strip():
-            p = fragment_fromstring('<p/>')
+            p = elem.makeelement('p', {})
             p.text = elem.text
             elem.text = None
             elem.insert(0, p)
@@ -234,7 +736,7 @@ def transform_misused_divs_into_paragraphs(html):
 
         for pos, child in reversed(list(enumerate(elem))):
             if child.tail and child.tail.strip():
-                p = fragment_fromstring('<p/>')
+                p = elem.makeelement('p', {})
                 p.text = child.tail
                 child.tail = None
                 elem.insert(pos + 1, p)
@@ -245,11 +747,13 @@ def transform_misused_divs_into_paragraphs(html):
     return html
 
 
-def transform_dynamic_images(html):
+def transform_dynamic_images(html, index=None):
     """
     Some sites use dynamic image loading normalize that.
 
     The pattern is an <img src='xyz' data-lazy-src'real-image.jpg'/><noscript><img src='real-image.jpg'/></noscript>
+
+    :param index: TextIndex to keep up to date while dropping nodes
     """
     to_remove = []
     for img in html.xpath('.//noscript/img'):
@@ -257,16 +761,23 @@ def transform_dynamic_images(html):
         if ov and len(ov) == 1:
             to_remove.append(img.getparent())
     for img in to_remove:
-        img.drop_tree()
+        if index is not None:
+            index.drop_tree(img)
+        else:
+            img.drop_tree()
     for img in html.xpath('.//img[@data-lazy-src]'):
         img.attrib['src'] = img.attrib['data-lazy-src']
 
 
-def text_length(i):
+def text_length(i, index=None):
+    if index is not None:
+        return index.text_length(i)
     return len(clean(i.text_content() or ""))
 
 
-def get_link_density(elem):
+def get_link_density(elem, index=None):
+    if index is not None:
+        return index.link_density(elem)
     link_length = 0
     for i in elem.findall(".//a"):
         link_length += text_length(i)
@@ -276,14 +787,14 @@ def get_link_density(elem):
     return float(link_length) / max(total_length, 1)
 
 
-def get_article(candidates, best_candidate):
+def get_article(candidates, best_candidate, index=None):
     # Now that we have the top candidate, look through its siblings for
     # content that might also be related.
     # Things like preambles, content split by ads that we removed, etc.
-    sibling_score_threshold = max([10, best_candidate['content_score'] * 0.2])
+    sibling_score_threshold = max([10, best_candidate.content_score * 0.2])
     # create a new html document with a html->body->div
     output = fragment_fromstring('<div/>')
-    best_elem = best_candidate['elem']
+    best_elem = best_candidate.elem
     for sibling in best_elem.getparent().getchildren():
         # in lxml there no concept of simple text
         # if isinstance(sibling, NavigableString): continue
@@ -291,11 +802,11 @@ def get_article(candidates, best_candidate):
         if sibling is best_elem:
             append = True
         sibling_key = sibling  # HashableElement(sibling)
-        if sibling_key in candidates and candidates[sibling_key]['content_score'] >= sibling_score_threshold:
+        if sibling_key in candidates and candidates[sibling_key].content_score >= sibling_score_threshold:
             append = True
 
         if sibling.tag == "p":
-            link_density = get_link_density(sibling)
+            link_density = get_link_density(sibling, index)
             node_content = sibling.text or ""
             node_length = len(node_content)
 
@@ -313,44 +824,59 @@ def get_article(candidates, best_candidate):
     return output
 
 
-def sanitize(node, candidates, min_len=25):
+def sanitize(node, candidates, min_len=25, index=None, trace=None):
+    """
+    Cleans up the article node, removing headers, forms and blocks that don't look like content.
+
+    :param index: TextIndex covering node, built here if not given
+    :param trace: Trace to record why each block is cleaned or kept in
+    """
+    if index is None:
+        index = TextIndex(node)
+    debug = log.isEnabledFor(logging.DEBUG)
     for header in tags(node, "h1", "h2", "h3", "h4", "h5", "h6"):
-        if class_weight(header) < 0 or get_link_density(header) > 0.33:
-            header.drop_tree()
+        weight = class_weight(header)
+        if weight < 0 or index.link_density(header) > 0.33:
+            if trace is not None:
+                trace.record('cleaned', header, weight=weight, link_density=index.link_density(header),
+                             reason='header with a negative weight or too many links')
+            index.drop_tree(header)
 
-    transform_dynamic_images(node)
+    transform_dynamic_images(node, index)
 
     for elem in tags(node, "form", "iframe", "textarea" ):
-        elem.drop_tree()
+        index.drop_tree(elem)
     allowed = {}
+    counted = TagCounts(node, ['p', 'img', 'li', 'a', 'embed', 'input'])
     # Conditionally clean <table>s, <ul>s, and <div>s
     for el in reverse_tags(node, "table", "ul", "div"):
         if el in allowed:
             continue
         weight = class_weight(el)
         if el in candidates:
-            content_score = candidates[el]['content_score']
+            content_score = candidates[el].content_score
             #print '!',el, '-> %6.3f' % content_score
         else:
             content_score = 0
         tag = el.tag
 
         if weight + content_score < 0:
-            logging.debug("Cleaned %s with score %6.3f and weight %-3s" % (describe(el), content_score, weight, ))
-            el.drop_tree()
-        elif el.text_content().count(",") < 10:
-            counts = {}
-            for kind in ['p', 'img', 'li', 'a', 'embed', 'input']:
-                counts[kind] = len(el.findall('.//%s' % kind))
+            if debug:
+                log.debug("Cleaned %s with score %6.3f and weight %-3s", describe(el), content_score, weight)
+            if trace is not None:
+                trace.record('cleaned', el, score=content_score, weight=weight, reason='negative score')
+            counted.drop_tree(el, index)
+        elif index.comma_count(el) < 10:
+            counts = counted.get(el)
             counts["li"] -= 100
 
             # Count the text length excluding any surrounding whitespace
-            content_length = text_length(el)
-            link_density = get_link_density(el)
+            content_length = index.text_length(el)
+            link_density = index.link_density(el)
             parent_node = el.getparent()
             if parent_node is not None:
                 if parent_node in candidates:
-                    content_score = candidates[parent_node]['content_score']
+                    content_score = candidates[parent_node].content_score
                 else:
                     content_score = 0
             #if parent_node is not None:
@@ -412,7 +938,7 @@ def sanitize(node, candidates, min_len=25):
                 siblings = []
                 for sib in el.itersiblings():
                     #logging.debug(sib.text_content())
-                    sib_content_length = text_length(sib)
+                    sib_content_length = index.text_length(sib)
                     if sib_content_length:
                         i =+ 1
                         siblings.append(sib_content_length)
@@ -420,7 +946,7 @@ def sanitize(node, candidates, min_len=25):
                             break
                 for sib in el.itersiblings(preceding=True):
                     #logging.debug(sib.text_content())
-                    sib_content_length = text_length(sib)
+                    sib_content_length = index.text_length(sib)
                     if sib_content_length:
                         j =+ 1
                         siblings.append(sib_content_length)
@@ -429,21 +955,34 @@ def sanitize(node, candidates, min_len=25):
                 #logging.debug(str(siblings))
                 if siblings and sum(siblings) > 1000:
                     to_remove = False
-                    logging.debug("Allowing %s" % describe(el))
+                    if debug:
+                        log.debug("Allowing %s", describe(el))
+                    if trace is not None:
+                        trace.record('allowed', el, reason=reason, siblings_length=sum(siblings))
                     for desnode in tags(el, "table", "ul", "div"):
                         allowed[desnode] = True
 
             if to_remove:
-                logging.debug("Cleaned %6.3f %s with weight %s cause it has %s." % (content_score, describe(el), weight, reason))
+                if debug:
+                    log.debug("Cleaned %6.3f %s with weight %s cause it has %s.", content_score, describe(el), weight, reason)
+                if trace is not None:
+                    trace.record('cleaned', el, score=content_score, weight=weight, reason=reason)
                 #print tounicode(el)
                 #logging.debug("pname %s pweight %.3f" %(pname, pweight))
-                el.drop_tree()
+                counted.drop_tree(el, index)
 
     # TODO: there was some code here to remove specific attributes from nodes
 
     return node
 
 
+def text_digest(elem):
+    """
+    Returns a digest of the whitespace normalized text of elem, blocks that only differ in whitespace get the same one.
+    """
+    return hashlib.md5(normalize_spaces(elem.text_content()).encode('utf-8')).digest()
+
+
 def remove_boilerplate(article, page_count):
     """
     Removes any content that shows up as many times as there are pages (e.g. boilerplate).
@@ -454,35 +993,27 @@ def remove_boilerplate(article, page_count):
     if page_count <= 1:
         return
 
-    # get the text size of each element
-    els = {}
-    for el in tags(article, 'div', 'header', 'section', 'footer', 'aside'):
-        els[el] = len(el.text_content())
-
-    # now look at pairs that are exactly the same length, if they are the same text exactly and appear
-    # page_count number of times, then they should be removed
-    to_remove = []
-    for el in els:
-        if el in to_remove:
+    # group the elements by the digest of their text in a single pass
+    els = []
+    groups = defaultdict(list)
+    for el in article.iter('div', 'header', 'section', 'footer', 'aside'):
+        if el is article:
             continue
-        length = els[el]
-        identicals = [el]
-        for e, l in els.iteritems():
-            if e != el and l == length and e.text_content() == el.text_content():
-                identicals.append(e)
-        # if there was one of these identical items per page, then we should probably
-        # remove it
+        els.append(el)
+        groups[text_digest(el)].append(el)
+
+    # if there was one of these identical items per page, then we should probably remove it
+    to_remove = set()
+    for identicals in groups.itervalues():
         if len(identicals) == page_count:
-            to_remove.extend(identicals)
+            to_remove.update(identicals)
 
-    logging.info('removing %d elements from the document' % len(to_remove))
+    log.info('removing %d elements from the document', len(to_remove))
 
-    for el in to_remove:
-        try:
+    for el in els:
+        # nodes inside something that is removed go with it
+        if el in to_remove and not any(a in to_remove for a in el.iterancestors()):
             el.drop_tree()
-        except StandardError:
-            # TODO: need to not try to remove things that are in a tree that has already been removed
-            logging.exception('could not remove this node')
 
 
 def score_possible_paging_url(baseurl, candidate, nextpage):
@@ -503,22 +1034,24 @@ def score_possible_paging_url(baseurl, candidate, nextpage):
             return path.split('/')
 
     candidateurl = candidate.attrib.get('href')
-    candidatetext = (candidate.text_content() or '').lower().strip()
     if candidateurl is None:
         return False
+    # the number of the next page has to be an element of the path, which is part of the url
+    if str(nextpage) not in candidateurl:
+        return 0
     base = urlparse(baseurl)
-    candidate = urlparse(candidateurl)
+    parts = urlparse(candidateurl)
 
     # if it's not the same domain 0 points
-    if not(base[0] == candidate[0] and base[1] == candidate[1]):
+    if not(base[0] == parts[0] and base[1] == parts[1]):
         return 0
     if '#' in candidateurl:
         return 0
 
     basepath = splitpath(base[2])
-    candidatepath = splitpath(candidate[2])
+    candidatepath = splitpath(parts[2])
     # if the path is the same and hte query params are the same, 0 points
-    if basepath == candidatepath and base[4] == candidate[4]:
+    if basepath == candidatepath and base[4] == parts[4]:
         return 0
     if len(candidatepath) < len(basepath):
         return 0
@@ -544,6 +1077,7 @@ def score_possible_paging_url(baseurl, candidate, nextpage):
     if not matched_page:
         return 0
 
+    candidatetext = (candidate.text_content() or '').lower().strip()
     score = 1
     if candidatetext == 'next':
         score += 1
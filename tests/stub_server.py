@@ -0,0 +1,88 @@
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path not in server.pages:
+                self.send_error(404)
+                return
+            body, delay = server.pages[self.path]
+            if delay:
+                time.sleep(delay)
+            body = body.encode('utf-8') if isinstance(body, unicode) else body
+            self.send_response(200)
+            self.send_header('Content-Type', server.content_type)
+            if server.chunk_size:
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for start in range(0, len(body), server.chunk_size):
+                    chunk = body[start:start + server.chunk_size]
+                    self.wfile.write('%x\r\n%s\r\n' % (len(chunk), chunk))
+                    self.wfile.flush()
+                    time.sleep(server.chunk_delay)
+                self.wfile.write('0\r\n\r\n')
+            else:
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP server serving canned pages, for testing fetching without the network.
+
+    Pages map a path to (body, delay), the delay being how long to wait before answering. With a chunk_size the
+    bodies are sent in chunks of that many bytes (Transfer-Encoding: chunked), chunk_delay seconds apart, like a
+    slow server would.
+    """
+    daemon_threads = True
+
+    def __init__(self, pages=None, chunk_size=None, chunk_delay=0, content_type='text/html; charset=utf-8'):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.pages = pages or {}
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.content_type = content_type
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def article_page(title, paragraphs=8, next_href=None):
+    """Returns a page that parses as an article, linking to the next page if next_href is given."""
+    text = ''.join('<p>%s paragraph %d, which goes on for a while so that it is long enough to count, and has a '
+                   'few commas, to score well, in the article.</p>' % (title, i) for i in range(paragraphs))
+    nav = '<a href="%s">next</a>' % next_href if next_href else ''
+    return ('<html><head><title>%s</title></head><body><div class="article">%s</div>%s</body></html>'
+            % (title, text, nav))
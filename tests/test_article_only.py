@@ -44,3 +44,30 @@ class TestArticleParsing(unittest.TestCase):
         article = doc.get_clean_article()
         self.assertIn('<img src="http://www.wired.com/images_blogs/design/2014/01/her-joaquin-phoenix-41-660x371.jpg"', article)
 
+
+class TestLimits(unittest.TestCase):
+    """
+    Low memory mode finds the same articles, and the limits cut pages down before they are parsed.
+    """
+
+    def test_low_memory(self):
+        paragraph = '<p>%s</p>' % ('All of the text on this page is in a block that looks like comments, ' * 3)
+        comments = '<html><body><div class="comments">%s</div></body></html>' % (paragraph * 5)
+        for sample in [load_sample('si-game.sample.html'), load_sample('wired.sample.html'), comments]:
+            doc = Document('http://example.com/', sample, low_memory=True)
+            self.assertEqual(None, doc.text)
+            self.assertEqual(Document('http://example.com/', sample).get_clean_article(), doc.get_clean_article())
+
+    def test_max_nodes(self):
+        sample = load_sample('si-game.sample.html')
+        self.assertEqual(None, Document('http://example.com/', sample, max_nodes=100000).truncated)
+        doc = Document('http://example.com/', sample, max_nodes=300)
+        self.assertEqual('nodes', doc.truncated)
+        self.assertEqual(300, sum(1 for _ in doc.html.iter()))
+
+    def test_max_size(self):
+        sample = load_sample('wired.sample.html')
+        doc = Document('http://example.com/', sample, max_size=len(sample) // 2)
+        self.assertEqual('size', doc.truncated)
+        self.assertEqual(sample, doc.text)
+        self.assertTrue(doc.article is not None)
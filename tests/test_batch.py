@@ -0,0 +1,48 @@
+import unittest
+
+from readability import extract_many
+from readability.readability import NotArticle
+from readability.readability import Unparseable
+from tests.stub_server import article_page
+
+
+DOCUMENTS = [
+    ('http://example.com/story/1', article_page('First')),
+    ('http://example.com/index', '<html><body><ul><li><a href="/a">a link</a></li></ul></body></html>'),
+    ('http://example.com/story/2', article_page('Second')),
+    ('http://example.com/empty', ''),
+]
+
+
+class TestExtractMany(unittest.TestCase):
+    """
+    Many documents can be extracted at once, in worker processes or in this one.
+    """
+
+    def check_results(self, results):
+        results = sorted(results, key=lambda r: r.index)
+        self.assertEqual([url for url, html in DOCUMENTS], [r.url for r in results])
+        self.assertIn('First paragraph 0', results[0].article)
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[1].error, NotArticle)
+        self.assertIn('Second paragraph 0', results[2].article)
+        self.assertIsInstance(results[3].error, Unparseable)
+
+    def test_in_order(self):
+        """With a pool the results come back in the order of the documents."""
+        results = list(extract_many(DOCUMENTS, processes=2))
+        self.assertEqual(range(len(DOCUMENTS)), [r.index for r in results])
+        self.check_results(results)
+
+    def test_as_completed(self):
+        """Unordered results can be matched up with their documents through the index."""
+        self.check_results(list(extract_many(DOCUMENTS, processes=2, chunksize=2, ordered=False)))
+
+    def test_in_process(self):
+        """One process means no pool at all."""
+        self.check_results(list(extract_many(DOCUMENTS, processes=1)))
+
+    def test_options(self):
+        """Document options are passed on to the workers."""
+        results = list(extract_many(DOCUMENTS[:1], processes=2, min_article_length=100000))
+        self.assertIsInstance(results[0].error, NotArticle)
@@ -0,0 +1,46 @@
+import unittest
+
+from benchmarks import run
+from benchmarks.synthetic import PageGenerator
+from readability import Document
+
+
+class TestPageGenerator(unittest.TestCase):
+
+    def test_deterministic(self):
+        self.assertEqual(PageGenerator(seed=3).page(), PageGenerator(seed=3).page())
+        self.assertNotEqual(PageGenerator(seed=3).page(), PageGenerator(seed=4).page())
+
+    def test_article_is_found(self):
+        doc = Document('http://example.com/article/1', PageGenerator(paragraphs=20).page())
+        self.assertTrue(doc.is_article)
+        self.assertEqual('article-body', doc.article.find('.//div').get('class'))
+
+    def test_pages_share_boilerplate(self):
+        generator = PageGenerator()
+        first, second = generator.page(1, 2), generator.page(2, 2)
+        header = first[first.index('<div class="header">'):first.index('<div class="main">')]
+        self.assertIn(header, second)
+        self.assertIn('/article/2', first)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_measure(self):
+        result = run.measure('small', 'remove_boilerplate', 2)
+        self.assertEqual('small', result['case'])
+        self.assertTrue(0 < result['seconds'] <= result['median'])
+        self.assertTrue(result['nodes'] > 0)
+
+    def test_compare(self):
+        def saved(seconds, peak_kb):
+            return {'results': {'small/parse': {'seconds': seconds, 'peak_kb': peak_kb}}}
+        lines, regressions = run.compare(saved(0.010, 1000), saved(0.0105, 1100))
+        self.assertEqual([], regressions)
+        lines, regressions = run.compare(saved(0.010, 1000), saved(0.020, 1000))
+        self.assertEqual(['small/parse'], regressions)
+        lines, regressions = run.compare(saved(0.010, 1000), saved(0.010, 5000))
+        self.assertEqual(['small/parse'], regressions)
+        # too small to tell
+        lines, regressions = run.compare(saved(0.0001, 1000), saved(0.0003, 1000))
+        self.assertEqual([], regressions)
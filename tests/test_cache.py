@@ -0,0 +1,131 @@
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+
+from readability import extract_many
+from readability import readability
+from readability.cache import ArticleCache, LRUCache, SqliteCache
+from readability.profiles import SiteProfiles
+from readability.readability import NotArticle
+from tests.stub_server import article_page
+from tests.test_batch import DOCUMENTS
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((1, None, 3), (cache.get('a'), cache.get('b'), cache.get('c')))
+        self.assertEqual({'entries': 2, 'hits': 3, 'misses': 1}, cache.stats())
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertEqual(None, cache.get('a'))
+
+
+class TestSqliteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'articles.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persists(self):
+        SqliteCache(self.path).set('a', u'caf\xe9')
+        cache = SqliteCache(self.path)
+        self.assertEqual(u'caf\xe9', cache.get('a'))
+        self.assertEqual('missing', cache.get('b', 'missing'))
+        self.assertEqual({'entries': 1, 'hits': 1, 'misses': 1}, cache.stats())
+
+    def test_none_is_a_value(self):
+        cache = SqliteCache(self.path)
+        cache.set('a', None)
+        self.assertEqual(None, cache.get('a', 'missing'))
+
+    def test_evicts_least_recently_used(self):
+        cache = SqliteCache(self.path, max_entries=2)
+        cache.set('a', u'1')
+        cache.set('b', u'2')
+        cache.get('a')
+        cache.set('c', u'3')
+        self.assertEqual(2, len(cache))
+        self.assertEqual('missing', cache.get('b', 'missing'))
+
+    def test_pickles(self):
+        cache = SqliteCache(self.path)
+        cache.set('a', u'1')
+        self.assertEqual(u'1', pickle.loads(pickle.dumps(cache)).get('a'))
+
+
+class TestArticleCache(unittest.TestCase):
+    """
+    Articles are cached by the content of the page and the options they were extracted with.
+    """
+
+    def test_key(self):
+        cache = ArticleCache()
+        key = cache.key('http://a/', '<p>x</p>')
+        self.assertEqual(key, cache.key('http://a/', '<p>x</p>', trace=object(), fetcher=object()))
+        self.assertNotEqual(key, cache.key('http://b/', '<p>x</p>'))
+        self.assertNotEqual(key, cache.key('http://a/', '<p>y</p>'))
+        self.assertNotEqual(key, cache.key('http://a/', '<p>x</p>', min_article_length=10))
+        self.assertNotEqual(key, cache.key('http://a/', '<p>x</p>', 'text/html; charset=koi8-r'))
+        self.assertEqual(key, cache.key('http://a/', '<p>x</p>', 'text/html'))
+        # a profiled parse can find another article, any profiles can
+        self.assertEqual(key, cache.key('http://a/', '<p>x</p>', profiles=None))
+        profiled = cache.key('http://a/', '<p>x</p>', profiles=SiteProfiles())
+        self.assertNotEqual(key, profiled)
+        self.assertEqual(profiled, cache.key('http://a/', '<p>x</p>', profiles=SiteProfiles()))
+
+    def test_hit_skips_parsing(self):
+        cache = ArticleCache()
+        html = article_page('Cached')
+        article = cache.clean_article('http://example.com/story', html)
+        self.assertEqual(readability.Document('http://example.com/story', html).get_clean_article(), article)
+
+        document = readability.Document
+        readability.Document = None
+        try:
+            self.assertEqual(article, cache.clean_article('http://example.com/story', html))
+        finally:
+            readability.Document = document
+        self.assertEqual(1, cache.stats()['hits'])
+
+    def test_not_article(self):
+        cache = ArticleCache()
+        html = '<html><body><a href="/">home</a></body></html>'
+        self.assertEqual(None, cache.clean_article('http://example.com/', html))
+        self.assertEqual((True, None), cache.get(cache.key('http://example.com/', html)))
+
+
+class TestExtractManyCache(unittest.TestCase):
+
+    def test_in_process(self):
+        cache = ArticleCache()
+        list(extract_many(DOCUMENTS, processes=1, cache=cache))
+        results = list(extract_many(DOCUMENTS, processes=1, cache=cache))
+        self.assertEqual([True, True, True, False], [r.cached for r in results])
+        self.assertIn('First paragraph 0', results[0].article)
+        self.assertTrue(isinstance(results[1].error, NotArticle))
+
+    def test_shared_by_workers(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ArticleCache(SqliteCache(os.path.join(directory, 'articles.db')))
+            list(extract_many(DOCUMENTS, processes=2, cache=cache))
+            results = list(extract_many(DOCUMENTS, processes=2, cache=cache))
+            self.assertEqual([True, True, True, False], [r.cached for r in results])
+            self.assertIn('Second paragraph 0', results[2].article)
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,40 @@
+import unittest
+
+from lxml.etree import tounicode
+from lxml.html import fragment_fromstring
+
+from readability.cleaners import clean_attributes, tounicode_clean
+from readability.readability import Document
+from tests.test_article_only import load_sample
+
+
+class TestTounicodeClean(unittest.TestCase):
+    """
+    Stripping attributes on the tree gives the html the regex over the serialized article does.
+    """
+
+    def assertCleansLike(self, html):
+        elem = fragment_fromstring(html)
+        before = tounicode(elem)
+        self.assertEqual(clean_attributes(before), tounicode_clean(elem))
+        # and leaves the tree as it was
+        self.assertEqual(before, tounicode(elem))
+
+    def test_bad_attributes(self):
+        self.assertCleansLike('<div class="a" style="color: red"><td width="3" height="4" bgcolor="red" '
+                              'background="x.png" data-color="x" colspan="2">t</td></div>')
+
+    def test_what_the_regex_leaves(self):
+        """Empty values, on* handlers and namespaced names stay, on* only matches 'o', 'on', 'onn'..."""
+        self.assertCleansLike('<div style="" onclick="f()" o="1" on="2" onn="3" x:color="4">t</div>')
+
+    def test_quoted_values(self):
+        self.assertCleansLike('<div title=\'say "hi"\' style="a: \'b\'"><p title="a&gt;b" style="x">t</p></div>')
+
+    def test_bad_attribute_inside_a_value(self):
+        self.assertCleansLike('<div><a title="x width=3" style="y">z</a></div>')
+
+    def test_samples(self):
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            doc = Document('http://example.com/', load_sample(sample))
+            self.assertEqual(clean_attributes(tounicode(doc.article)), doc.get_clean_article())
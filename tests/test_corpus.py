@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from readability import corpus
+from readability.batch import BadRecord
+from readability.readability import main
+from tests.stub_server import article_page
+
+
+def warc_record(kind, url, block, length=None):
+    return ('WARC/1.0\r\nWARC-Type: %s\r\nWARC-Target-URI: %s\r\nContent-Length: %s\r\n\r\n%s\r\n\r\n'
+            % (kind, url, len(block) if length is None else length, block))
+
+
+class TestReaders(unittest.TestCase):
+    """
+    Records of a crawl can be read from JSON lines and WARC files.
+    """
+
+    def test_jsonl(self):
+        stream = StringIO('{"url": "http://a/", "html": "<p>a</p>"}\n\n{"url": "http://b/", "html": "<p>b</p>"}\n')
+        self.assertEqual([('http://a/', '<p>a</p>'), ('http://b/', '<p>b</p>')], list(corpus.read_jsonl(stream)))
+
+    def test_warc(self):
+        """Responses lose their HTTP headers, requests and metadata are skipped."""
+        stream = StringIO(
+            warc_record('warcinfo', '', 'software: test') +
+            warc_record('request', 'http://a/', 'GET / HTTP/1.1\r\n\r\n') +
+            warc_record('response', 'http://a/', 'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<p>a</p>') +
+            warc_record('resource', 'http://b/', '<p>b</p>'))
+        self.assertEqual([('http://a/', '<p>a</p>'), ('http://b/', '<p>b</p>')], list(corpus.read_warc(stream)))
+
+    def test_bad_jsonl(self):
+        """Lines that aren't JSON objects are given as bad records, with their line numbers."""
+        stream = StringIO('{not json\n["a list"]\n{"url": "http://a/", "html": "<p>a</p>"}\n')
+        records = list(corpus.read_jsonl(stream))
+        self.assertEqual(('http://a/', '<p>a</p>'), records[2])
+        self.assertEqual([None, None], [url for url, html in records[:2]])
+        self.assertTrue(all(isinstance(html, BadRecord) for url, html in records[:2]))
+        self.assertTrue(str(records[0][1]).startswith('line 1: '))
+        self.assertEqual('line 2: not a JSON object', str(records[1][1]))
+
+    def test_bad_warc(self):
+        """A record without a length or that isn't a WARC record is a bad record, the next ones are read."""
+        garbage = 'garbage\r\n\r\n'
+        bad = warc_record('resource', 'http://bad/', '<p>bad</p>\r\n\r\nWARC', length='many')
+        stream = StringIO(garbage + bad + warc_record('resource', 'http://b/', '<p>b</p>'))
+        records = list(corpus.read_warc(stream))
+        self.assertEqual([None, 'http://bad/', 'http://b/'], [url for url, html in records])
+        self.assertEqual("record at offset 0: not a WARC record: 'garbage\\r\\n'", str(records[0][1]))
+        self.assertIsInstance(records[1][1], BadRecord)
+        self.assertIn('record at offset %d: invalid literal' % len(garbage), str(records[1][1]))
+        self.assertEqual('<p>b</p>', records[2][1])
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(50, corpus.percentile(values, 0.5))
+        self.assertEqual(99, corpus.percentile(values, 0.99))
+        self.assertEqual(7, corpus.percentile([7], 0.99))
+
+
+class TestBulkCommandLine(unittest.TestCase):
+    """
+    The command line extracts a whole corpus in one run, writing JSON lines as articles are done.
+    """
+
+    def run_main(self, argv, stdin):
+        saved = sys.argv, sys.stdin, sys.stdout, sys.stderr, logging.getLogger().level
+        sys.argv, sys.stdin, sys.stdout, sys.stderr = ['readability'] + argv, StringIO(stdin), StringIO(), StringIO()
+        try:
+            main()
+            return sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.argv, sys.stdin, sys.stdout, sys.stderr = saved[:4]
+            logging.getLogger().setLevel(saved[4])
+
+    records = [
+        {'url': 'http://example.com/story/1', 'html': article_page('First')},
+        {'url': 'http://example.com/index', 'html': '<html><body><a href="/">home</a></body></html>'},
+        {'url': 'http://example.com/story/2', 'html': article_page('Second')},
+    ]
+
+    def test_jsonl_from_stdin(self):
+        records = self.records
+        out, err = self.run_main(['--bulk', 'jsonl', '--jobs', '2'], ''.join(json.dumps(r) + '\n' for r in records))
+        articles = dict((r['url'], r['article']) for r in map(json.loads, out.splitlines()))
+        self.assertEqual(['http://example.com/story/1', 'http://example.com/story/2'], sorted(articles))
+        self.assertIn('Second paragraph 0', articles['http://example.com/story/2'])
+        self.assertIn('3 documents (1 failed)', err)
+        self.assertIn('documents/sec, latency p50', err)
+        self.assertIn('1 of the failed turned down by the prefilter', err)
+
+    def test_bad_records(self):
+        """Records that can't be read are counted as failures and the run carries on."""
+        first, bad, second = self.records[0], self.records[1], self.records[2]
+        stdin = json.dumps(first) + '\n{not json\n' + json.dumps(second) + '\n'
+        out, err = self.run_main(['--bulk', 'jsonl', '--jobs', '2'], stdin)
+        self.assertEqual([first['url'], second['url']], sorted(json.loads(line)['url'] for line in out.splitlines()))
+        self.assertIn('3 documents (1 failed)', err)
+        self.assertIn('1 of the failed unreadable', err)
+
+        stdin = (warc_record('resource', first['url'], first['html']) +
+                 warc_record('resource', 'http://example.com/bad', '<p>bad</p>', length='-') +
+                 warc_record('resource', second['url'], second['html']))
+        out, err = self.run_main(['--bulk', 'warc', '--jobs', '2'], stdin)
+        self.assertEqual([first['url'], second['url']], sorted(json.loads(line)['url'] for line in out.splitlines()))
+        self.assertIn('3 documents (1 failed)', err)
+        self.assertIn('1 of the failed unreadable', err)
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            argv = ['--bulk', 'jsonl', '--jobs', '2', '--cache', os.path.join(directory, 'articles.db')]
+            stdin = ''.join(json.dumps(r) + '\n' for r in self.records)
+            first, err = self.run_main(argv, stdin)
+            self.assertNotIn('cached', err)
+            second, err = self.run_main(argv, stdin)
+            self.assertIn('3 documents (1 failed, 3 cached)', err)
+            self.assertEqual(sorted(first.splitlines()), sorted(second.splitlines()))
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import codecs
+import unittest
+
+from readability import encoding
+from readability.htmls import build_doc
+
+
+TEXT = u'Съешь же ещё этих мягких французских булок, да выпей чаю. ' * 20
+RUSSIAN = u'<html><body><p>%s</p></body></html>' % TEXT
+
+
+class TestDetectEncoding(unittest.TestCase):
+    """
+    The encoding is taken from the cheapest source that knows it.
+    """
+
+    def test_bom(self):
+        page = codecs.BOM_UTF8 + RUSSIAN.encode('utf-8')
+        self.assertEqual(('utf-8-sig', 'bom'), encoding.detect_encoding(page, 'text/html; charset=cp1251'))
+        self.assertEqual('utf-16', encoding.detect_encoding(RUSSIAN.encode('utf-16'))[0])
+
+    def test_http_header(self):
+        page = RUSSIAN.encode('cp1251')
+        self.assertEqual(('cp1251', 'http'), encoding.detect_encoding(page, 'text/html; charset=windows-1251'))
+
+    def test_unknown_http_charset_is_ignored(self):
+        page = RUSSIAN.encode('utf-8')
+        self.assertEqual(('utf-8', 'utf-8'), encoding.detect_encoding(page, 'text/html; charset=nonsense'))
+
+    def test_meta(self):
+        page = '<html><head><meta charset="koi8-r"></head>' + RUSSIAN.encode('koi8-r')
+        self.assertEqual(('koi8-r', 'meta'), encoding.detect_encoding(page))
+        page = '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8" />' + RUSSIAN.encode('utf-8')
+        self.assertEqual(('utf-8', 'meta'), encoding.detect_encoding(page))
+
+    def test_meta_too_far_down_is_ignored(self):
+        page = RUSSIAN.encode('utf-8') + ' ' * encoding.META_BYTES + '<meta charset="koi8-r">'
+        self.assertEqual(('utf-8', 'utf-8'), encoding.detect_encoding(page))
+
+    def test_chardet(self):
+        self.assertEqual(('cp1251', 'chardet'), encoding.detect_encoding(RUSSIAN.encode('cp1251')))
+
+    def test_too_little_text(self):
+        self.assertEqual(('utf-8', 'default'), encoding.detect_encoding('<p>\xff</p>'))
+
+    def test_strategies_are_counted(self):
+        before = encoding.strategies['http']
+        doc, enc = build_doc(RUSSIAN.encode('cp1251'), 'text/html; charset=windows-1251')
+        self.assertEqual('cp1251', enc)
+        self.assertEqual(before + 1, encoding.strategies['http'])
+        self.assertIn(u'французских', doc.text_content())
+
+
+class TestBuildDoc(unittest.TestCase):
+    """
+    Pages that are UTF-8 or plain ASCII already are parsed without decoding them, all pages parse the same.
+    """
+
+    def assertParsesLike(self, page, expected, content_type=None):
+        doc, enc = build_doc(page, content_type)
+        self.assertEqual(expected, doc.text_content())
+
+    def test_utf8(self):
+        self.assertParsesLike(RUSSIAN.encode('utf-8'), TEXT)
+        self.assertParsesLike(codecs.BOM_UTF8 + RUSSIAN.encode('utf-8'), TEXT)
+
+    def test_utf8_is_checked_once(self):
+        """The check detect_encoding made that the page is UTF-8 isn't made again, a declared UTF-8 is checked."""
+        original_decodes = encoding.decodes
+        checked = []
+
+        def decodes(page, codec):
+            checked.append(codec)
+            return original_decodes(page, codec)
+        encoding.decodes = decodes
+        try:
+            self.assertParsesLike(RUSSIAN.encode('utf-8'), TEXT)
+            self.assertEqual(['utf-8'], checked)
+            del checked[:]
+            self.assertParsesLike(RUSSIAN.encode('utf-8'), TEXT, 'text/html; charset=utf-8')
+            self.assertEqual(['utf-8'], checked)
+            del checked[:]
+            build_doc(RUSSIAN.encode('cp1251'))
+            self.assertEqual(['utf-8'], checked)
+        finally:
+            encoding.decodes = original_decodes
+
+    def test_declared_utf8_that_isnt(self):
+        page = RUSSIAN.encode('cp1251')
+        self.assertParsesLike(page, page.decode('utf-8', 'replace')[15:-18], 'text/html; charset=utf-8')
+
+    def test_ascii(self):
+        self.assertTrue(encoding.is_ascii('<p>plain</p>'))
+        self.assertFalse(encoding.is_ascii('<p>caf\xe9</p>'))
+        self.assertParsesLike('<p>plain</p>', u'plain', 'text/html; charset=iso-8859-1')
+
+    def test_seven_bit_encodings_are_decoded(self):
+        text = u'<p>日本語のテキスト</p>'
+        page = text.encode('iso-2022-jp')
+        self.assertFalse(encoding.is_ascii(page))
+        self.assertParsesLike(page, u'日本語のテキスト', 'text/html; charset=iso-2022-jp')
+        self.assertParsesLike(u'<p>1+1</p>'.encode('utf-7'), u'1+1', 'text/html; charset=utf-7')
+
+    def test_unicode(self):
+        self.assertParsesLike(RUSSIAN, TEXT)
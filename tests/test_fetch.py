@@ -0,0 +1,173 @@
+import threading
+import time
+import unittest
+
+import requests
+
+from readability.fetch import Fetcher
+from readability.htmls import DocBuilder
+from readability.readability import Document
+from readability.readability import NotArticle
+from readability.readability import get_article
+from tests.stub_server import StubServer
+from tests.stub_server import article_page
+
+
+class TestFetcher(unittest.TestCase):
+    """
+    Pages are fetched over shared connections with limits and timeouts.
+    """
+
+    def setUp(self):
+        self.server = StubServer({
+            '/page': ('<html><body>hello</body></html>', 0),
+            '/slow': ('<html><body>slow</body></html>', 0.3),
+        })
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connections_are_reused(self):
+        """Fetching several pages from a host goes over a single kept-alive connection."""
+        fetcher = Fetcher()
+        for i in range(3):
+            self.assertIn('hello', fetcher.fetch(self.server.url('/page')))
+        self.assertEqual(1, len(self.server.connections))
+
+    def test_timeout(self):
+        """A server slower than the timeout makes the fetch fail instead of hanging."""
+        fetcher = Fetcher(timeout=0.1)
+        self.assertRaises(requests.Timeout, fetcher.fetch, self.server.url('/slow'))
+
+    def test_per_host_limit(self):
+        """No more than max_per_host requests are sent to the same host at once."""
+        fetcher = Fetcher(max_per_host=2)
+        threads = [threading.Thread(target=fetcher.fetch, args=(self.server.url('/slow'),)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(2, self.server.max_active)
+
+    def test_prefetch(self):
+        """A prefetched page downloads in the background while the caller does something else."""
+        fetcher = Fetcher()
+        start = time.time()
+        pending = fetcher.prefetch(self.server.url('/slow'))
+        self.assertLess(time.time() - start, 0.2)
+        content, content_type = pending.result()
+        self.assertIn('slow', content)
+        self.assertEqual('text/html; charset=utf-8', content_type)
+        self.assertTrue(pending.done())
+
+
+class TestPagination(unittest.TestCase):
+    """
+    get_article follows next page links through the fetcher.
+    """
+
+    def setUp(self):
+        self.server = StubServer()
+        pages = self.server.pages
+        pages['/story/1'] = (article_page('First', next_href='/story/2'), 0)
+        pages['/story/2'] = (article_page('Second', next_href='/story/3'), 0.2)
+        pages['/story/3'] = (article_page('Third', next_href='/story/4'), 0.2)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_follows_pages(self):
+        """All pages are fetched once, over one connection, and make it into the article; a missing page ends it."""
+        article = get_article(self.server.url('/story/1'), fetcher=Fetcher())
+        for title in ['First', 'Second', 'Third']:
+            self.assertIn('%s paragraph 0' % title, article)
+        self.assertEqual(['/story/1', '/story/2', '/story/3', '/story/4'], self.server.requests)
+        self.assertEqual(1, len(self.server.connections))
+
+    def test_next_page_is_prefetched(self):
+        """The next page is requested before the current one is parsed, once the first one is an article."""
+        fetcher = Fetcher()
+        events = []
+        original_prefetch = fetcher.prefetch
+        original_parse = Document.parse
+
+        def prefetch(url):
+            events.append(('prefetch', url))
+            return original_prefetch(url)
+
+        def parse(doc):
+            events.append(('parse', doc.url))
+            return original_parse(doc)
+        fetcher.prefetch = prefetch
+        Document.parse = parse
+        try:
+            get_article(self.server.url('/story/1'), fetcher=fetcher)
+        finally:
+            Document.parse = original_parse
+        self.assertEqual([('parse', self.server.url('/story/1')), ('prefetch', self.server.url('/story/2')),
+                          ('prefetch', self.server.url('/story/3')), ('parse', self.server.url('/story/2')),
+                          ('prefetch', self.server.url('/story/4')), ('parse', self.server.url('/story/3')),
+                          ('parse', self.server.url('/story/4'))], events)
+        self.assertEqual(['/story/1', '/story/2', '/story/3', '/story/4'], self.server.requests)
+
+    def test_not_article_next_page_is_not_fetched(self):
+        """A page that isn't an article is turned down without looking for its next page or fetching it."""
+        self.server.pages['/list/1'] = ('<html><body><ul><li><a href="/story/1">First</a></li></ul>'
+                                        '<a href="/list/2">next</a></body></html>', 0)
+        original_next_page_url = Document.get_next_page_url
+        Document.get_next_page_url = lambda doc: self.fail('looked for the next page of %s' % doc.url)
+        try:
+            self.assertRaises(NotArticle, get_article, self.server.url('/list/1'), fetcher=Fetcher())
+        finally:
+            Document.get_next_page_url = original_next_page_url
+        self.assertEqual(['/list/1'], self.server.requests)
+
+
+class TestStreaming(unittest.TestCase):
+    """
+    A streamed document is parsed while the page downloads and ends up the same as a fetched one.
+    """
+
+    def setUp(self):
+        self.server = StubServer(chunk_size=512, chunk_delay=0.01)
+        self.server.pages['/story'] = (article_page('Streamed', paragraphs=40), 0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_same_as_fetched(self):
+        """Streaming doesn't change the article, text or encoding of a document."""
+        url = self.server.url('/story')
+        fetched = Document(url=url, fetcher=Fetcher())
+        streamed = Document(url=url, fetcher=Fetcher(), stream=True)
+        self.assertEqual(fetched.text, streamed.text)
+        self.assertEqual(fetched.encoding, streamed.encoding)
+        self.assertEqual(fetched.get_clean_article(), streamed.get_clean_article())
+        self.assertIn('Streamed paragraph 39', streamed.get_clean_article())
+
+    def test_parses_while_downloading(self):
+        """Chunks are fed to the parser as they arrive rather than all at once at the end."""
+        original_feed = DocBuilder.feed
+        times = []
+
+        def feed(builder, chunk):
+            times.append(time.time())
+            return original_feed(builder, chunk)
+        DocBuilder.feed = feed
+        try:
+            Document(url=self.server.url('/story'), fetcher=Fetcher(), stream=True)
+        finally:
+            DocBuilder.feed = original_feed
+        self.assertGreater(len(times), 10)
+        self.assertGreater(times[-1] - times[0], 0.1)
+
+    def test_max_size(self):
+        """Reading stops at max_size and the host slot is given back."""
+        url = self.server.url('/story')
+        fetcher = Fetcher(max_per_host=1)
+        doc = Document(url=url, fetcher=fetcher, stream=True, max_size=2000)
+        self.assertEqual('size', doc.truncated)
+        self.assertLessEqual(len(doc.text), 2000)
+        self.assertNotIn('Streamed paragraph 39', doc.get_clean_article())
+        self.assertTrue(fetcher._host_slots(url).acquire(False))
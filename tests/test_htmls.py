@@ -0,0 +1,104 @@
+import unittest
+
+from lxml import etree
+
+# -*- coding: utf-8 -*-
+from lxml.html import document_fromstring
+from lxml.html import tostring
+
+from readability.htmls import DocBuilder
+from readability.htmls import TITLE_SELECTORS
+from readability.htmls import build_doc
+from readability.htmls import shorten_title
+from readability.htmls import title_candidates
+from readability.htmls import truncate_page
+from readability.htmls import truncate_tree
+
+
+class TestShortenTitle(unittest.TestCase):
+    """
+    The title candidates are gathered in two walks but come out as they did from a query per selector.
+    """
+
+    def test_candidates_match_the_selectors(self):
+        doc = document_fromstring(
+            '<html><head><title>t</title></head><body><h2 class="title">a</h2><div id="head">b</div>'
+            '<h1>c</h1><span class=" head\tx title title">d</span><p class="titles">e</p><p id="Title">f</p>'
+            '<h3 id="heading"><b class="pageTitle">g</b></h3></body></html>')
+        for selector, elements in zip(TITLE_SELECTORS, title_candidates(doc)):
+            expected = list(doc.iterfind('.//' + selector)) if selector[0] not in '#.' else doc.cssselect(selector)
+            self.assertEqual(expected, elements, selector)
+
+    def test_heading_in_the_title(self):
+        doc = document_fromstring(
+            '<html><head><title>How the new thing came to be | Example News</title></head><body>'
+            '<div class="menu"><h3>Example News</h3></div><h1>How the <em>new thing</em> came to be</h1>'
+            '<p>text</p></body></html>')
+        self.assertEqual('How the new thing came to be', shorten_title(doc))
+
+    def test_delimiters(self):
+        doc = document_fromstring('<html><head><title>Example News - How the new thing came to be</title></head>'
+                                  '<body><p>text</p></body></html>')
+        self.assertEqual('How the new thing came to be', shorten_title(doc))
+
+
+class TestTruncate(unittest.TestCase):
+    """
+    Pages over the limits are cut down, keeping everything before the cut.
+    """
+
+    def test_page_is_cut_before_a_tag(self):
+        page = '<p>first</p><p>second</p>'
+        self.assertEqual(page, truncate_page(page, 100))
+        self.assertEqual('<p>first</p>', truncate_page(page, 20))
+        self.assertEqual('abcd', truncate_page('abcdef', 4))
+
+    def test_nodes_after_the_limit_are_removed(self):
+        doc = document_fromstring('<html><body><div><p>a<b>b</b>c</p>tail<p>d</p></div><p>e</p></body></html>')
+        self.assertFalse(truncate_tree(doc, 7))
+        self.assertTrue(truncate_tree(doc, 5))
+        self.assertEqual('<html><body><div><p>a<b>b</b>c</p>tail</div></body></html>', tostring(doc))
+
+
+class TestDocBuilder(unittest.TestCase):
+    """
+    A page parsed a chunk at a time gives the same document and encoding as build_doc does for all of it.
+    """
+
+    def assertBuildsLike(self, page, content_type=None):
+        expected, expected_enc = build_doc(page, content_type)
+        for size in [1, 100, 5000, len(page)]:
+            builder = DocBuilder(content_type)
+            for start in range(0, len(page), size):
+                builder.feed(page[start:start + size])
+            doc, enc = builder.close()
+            self.assertEqual(etree.tostring(expected), etree.tostring(doc))
+            # lxml's tag lookups work on it
+            self.assertEqual(len(list(expected.iter('p'))), len(list(doc.iter('p'))))
+            self.assertEqual(expected_enc, enc)
+            self.assertEqual(page, builder.page)
+
+    def test_encodings(self):
+        text = u'<html><head><title>Caf\xe9</title></head><body>%s</body></html>' % (
+            u'<p>na\xefve caf\xe9, \u20ac</p>' * 400)
+        self.assertBuildsLike(text.encode('utf-8'))
+        self.assertBuildsLike(text.encode('utf-16'))
+        self.assertBuildsLike(text.encode('latin-1', 'replace'), 'text/html; charset=iso-8859-1')
+        self.assertBuildsLike(text.replace('<head>', '<head><meta charset="cp1252">').encode('cp1252'))
+        # not UTF-8 and not declared, found out after the first chunks were parsed
+        self.assertBuildsLike(text.encode('utf-8') + u'<p>\xe9</p>'.encode('latin-1'))
+
+    def test_meta_in_scripts_and_comments(self):
+        """A <meta in the text of a script, a comment or a style before the page's first <meta> isn't taken for it."""
+        text = u'<html lang="fr"><head id="top"><script>var s = "<meta";</script><!-- <meta name="old"> -->' \
+               u'<style>/* <meta */</style><meta charset="cp1252"><title>Caf\xe9</title></head><body>%s</body></html>' % (
+                   u'<p>na\xefve caf\xe9, \u20ac</p>' * 400)
+        self.assertBuildsLike(text.encode('cp1252'))
+
+    def test_max_size(self):
+        builder = DocBuilder(max_size=20, keep_page=False)
+        self.assertTrue(builder.feed('<p>first</p>'))
+        self.assertFalse(builder.feed('<p>second</p>'))
+        doc, enc = builder.close()
+        self.assertEqual(['first'], [p.text for p in doc.iter('p')])
+        self.assertEqual(None, builder.page)
@@ -0,0 +1,59 @@
+import unittest
+
+from lxml.html import fragment_fromstring
+
+from readability import nodetable
+from readability import utils
+from readability.htmls import build_doc
+from readability.readability import Document
+from readability.tracing import Trace
+from tests.test_article_only import load_sample
+
+
+class TestNodeTable(unittest.TestCase):
+    """
+    Scoring over the node table has to find the same candidates, with the same scores, as scoring the tree.
+    """
+
+    def assertScoresLike(self, html):
+        index = utils.TextIndex(html)
+        expected_trace, trace = Trace(), Trace()
+        expected = utils.score_paragraphs(html, index=index, trace=expected_trace)
+        candidates = nodetable.score_paragraphs(html, index=index, trace=trace)
+        self.assertEqual(set(expected), set(candidates))
+        for elem, candidate in expected.iteritems():
+            self.assertEqual(repr(candidate['content_score']), repr(candidates[elem]['content_score']))
+            self.assertIs(elem, candidates[elem]['elem'])
+        self.assertEqual(expected_trace.events, trace.events)
+
+    def assertScoresLikeWithoutNumpy(self, html):
+        self.assertScoresLike(html)
+        if nodetable.numpy is not None:
+            numpy, nodetable.numpy = nodetable.numpy, None
+            try:
+                self.assertScoresLike(html)
+            finally:
+                nodetable.numpy = numpy
+
+    def test_samples(self):
+        """The candidates of the sample pages and the trace of their scores are the same."""
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            doc, enc = build_doc(load_sample(sample))
+            html = utils.transform_misused_divs_into_paragraphs(doc)
+            self.assertScoresLikeWithoutNumpy(html)
+            self.assertScoresLikeWithoutNumpy(html.find('body'))
+
+    def test_paragraphs_of_every_kind(self):
+        """Paragraphs right under the root, in the same parent and of different tags all add up the same."""
+        text = 'A sentence, with commas, that is long enough to count as a paragraph. ' * 3
+        html = fragment_fromstring(
+            '<div><p>%s</p><section class="comment"><p>%s</p><pre>%s</pre><p>short</p></section>'
+            '<table><tr><td>%s</td><td>%s <a href="#">%s</a></td></tr></table></div>' % ((text,) * 6))
+        self.assertScoresLikeWithoutNumpy(html)
+
+    def test_document(self):
+        """A document scored over the table ends up with the same article."""
+        sample = load_sample('si-game.sample.html')
+        expected = Document('http://example.com/', sample).get_clean_article()
+        self.assertEqual(expected, Document('http://example.com/', sample, scoring='table').get_clean_article())
+        self.assertRaises(ValueError, Document, 'http://example.com/', sample, scoring='vectors')
@@ -0,0 +1,67 @@
+import pickle
+import unittest
+
+from lxml.html import document_fromstring
+
+from readability import Document
+from readability import extract_many
+from readability.cache import ArticleCache
+from readability.prefilter import Prefilter
+from readability.prefilter import page_stats
+from readability.tracing import Timings
+from tests.stub_server import article_page
+from tests.test_article_only import load_sample
+from tests.test_batch import DOCUMENTS
+
+
+LISTING = '<html><body><ul>%s</ul></body></html>' % ''.join(
+    '<li><a href="/story/%d">Story number %d, with a headline long enough to read</a> 5 min</li>' % (i, i)
+    for i in range(30))
+
+
+class TestPrefilter(unittest.TestCase):
+    """
+    Pages that clearly aren't articles are turned down without parsing them.
+    """
+
+    def test_page_stats(self):
+        html = document_fromstring('<html><body><p>%s <a href="/">a link</a></p><div>short</div></body></html>'
+                                   % ('x' * 30))
+        self.assertEqual((42, 6, 1), page_stats(html))
+
+    def test_defaults_only_turn_down_short_pages(self):
+        prefilter = Prefilter()
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            self.assertEqual(None, prefilter.check(Document('http://example.com/', load_sample(sample)).html, 250))
+        self.assertEqual(None, prefilter.check(document_fromstring(LISTING), 250))
+        self.assertEqual('text', prefilter.check(document_fromstring('<p>%s</p>' % ('x' * 249)), 250))
+        self.assertEqual({'checked': 4, 'rejected': 1, 'reasons': {'text': 1}}, prefilter.stats())
+
+    def test_thresholds(self):
+        listing = document_fromstring(LISTING)
+        self.assertEqual('links', Prefilter(max_link_density=0.6).check(listing))
+        self.assertEqual('paragraphs', Prefilter(min_paragraphs=3).check(listing))
+        article = Document('http://example.com/', article_page('Story')).html
+        self.assertEqual(None, Prefilter(min_paragraphs=3, max_link_density=0.6).check(article, 250))
+
+    def test_rejected_pages_are_not_parsed(self):
+        timings = Timings()
+        doc = Document('http://example.com/', LISTING, timer=timings, prefilter=Prefilter(max_link_density=0.6))
+        self.assertFalse(doc.is_article)
+        self.assertEqual('links', doc.rejected_by)
+        self.assertIn('prefilter', timings.stages)
+        self.assertNotIn('ruthless:copy', timings.stages)
+
+    def test_pickles_and_keys(self):
+        prefilter = pickle.loads(pickle.dumps(Prefilter(min_paragraphs=3)))
+        self.assertEqual('paragraphs', prefilter.check(document_fromstring(LISTING)))
+        cache = ArticleCache()
+        self.assertEqual(cache.key('http://a/', LISTING, prefilter=Prefilter(min_paragraphs=3)),
+                         cache.key('http://a/', LISTING, prefilter=prefilter))
+        self.assertNotEqual(cache.key('http://a/', LISTING, prefilter=Prefilter()),
+                            cache.key('http://a/', LISTING, prefilter=prefilter))
+
+    def test_extract_many(self):
+        results = list(extract_many(DOCUMENTS, processes=2, prefilter=Prefilter(min_text_length=100)))
+        self.assertEqual([None, 'text', None, None], [r.rejected_by for r in results])
+        self.assertIn('First paragraph 0', results[0].article)
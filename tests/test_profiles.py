@@ -0,0 +1,101 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from copy import deepcopy
+
+from lxml.html import document_fromstring
+
+from benchmarks.synthetic import PageGenerator
+from readability import utils
+from readability.profiles import SiteProfiles
+from readability.profiles import find_path
+from readability.profiles import path_of
+from readability.readability import Document
+from tests.test_article_only import load_sample
+
+
+class TestPaths(unittest.TestCase):
+    """
+    A path leads back to its element, in the page and from the copies the passes make of it.
+    """
+
+    def test_every_element(self):
+        doc = document_fromstring(load_sample('wired.sample.html'))
+        for elem in doc.iter('*'):
+            self.assertIs(elem, find_path(doc, path_of(elem)))
+
+    def test_learned_on_a_transformed_copy(self):
+        """<div>s turned into <p>s and the id given to the body don't change the path."""
+        doc = document_fromstring('<html><body class="site"><div class="row">intro</div><div class="row">'
+                                  '<div id="story"><p>text</p></div></div></body></html>')
+        copy = deepcopy(doc)
+        copy.find('body').set('id', 'readabilityBody')
+        utils.transform_misused_divs_into_paragraphs(copy)
+        self.assertEqual('p', copy.find('body')[0].tag)
+        path = path_of(copy.get_element_by_id('story'))
+        self.assertIs(doc.get_element_by_id('story'), find_path(doc, path))
+        self.assertEqual(None, find_path(doc, [['body', '', '', 0], ['div', '', 'row', 2]]))
+
+
+class TestSiteProfiles(unittest.TestCase):
+    """
+    Documents of a site parse around where the article of its pages was once a profile is learned.
+    """
+
+    def setUp(self):
+        self.generator = PageGenerator(paragraphs=20)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def parse(self, number, profiles, page=None, host='example.com'):
+        url = 'http://%s/article/%d' % (host, number)
+        page = page or self.generator.page(number, 3)
+        doc = Document(url, page, profiles=profiles)
+        self.assertEqual(Document(url, page).get_clean_article(), doc.get_clean_article())
+        return doc
+
+    def test_later_pages_use_the_profile(self):
+        profiles = SiteProfiles()
+        self.assertEqual('ruthless', self.parse(1, profiles).parsed_by)
+        self.assertEqual({'hosts': 1, 'hits': 0, 'misses': 1, 'rejected': 0}, profiles.stats())
+        self.assertEqual('profile', self.parse(2, profiles).parsed_by)
+        self.assertEqual('profile', self.parse(3, profiles).parsed_by)
+        self.assertEqual({'hosts': 1, 'hits': 2, 'misses': 1, 'rejected': 0}, profiles.stats())
+
+    def test_repeated_ancestors(self):
+        """The article is found under an ancestor after others like it and after the siblings the pass dropped."""
+        def page(number):
+            text = ''.join('<p>Paragraph %d of story %d, long enough to count, with a comma or two, for the score.</p>'
+                           % (i, number) for i in range(8))
+            return '<html><body><div class="row"><p>Menu</p></div><div class="row"><section>Ad</section></div>' \
+                   '<div class="row"><section><div class="sidebar">Related</div><div class="story">%s</div>' \
+                   '</section></div></body></html>' % text
+        profiles = SiteProfiles()
+        self.assertEqual('ruthless', self.parse(1, profiles, page(1)).parsed_by)
+        self.assertEqual('profile', self.parse(2, profiles, page(2)).parsed_by)
+        self.assertEqual({'hosts': 1, 'hits': 1, 'misses': 1, 'rejected': 0}, profiles.stats())
+
+    def test_changed_template(self):
+        """A profile that doesn't fit the page anymore is rejected, the page parsed in full and learned again."""
+        profiles = SiteProfiles()
+        self.parse(1, profiles)
+        changed = [self.generator.page(number, 3).replace('article-body', 'story-text') for number in (2, 3)]
+        self.assertEqual('ruthless', self.parse(2, profiles, changed[0]).parsed_by)
+        self.assertEqual('profile', self.parse(3, profiles, changed[1]).parsed_by)
+        self.assertEqual({'hosts': 1, 'hits': 1, 'misses': 1, 'rejected': 1}, profiles.stats())
+
+    def test_saved(self):
+        """The profiles of the most recently learned hosts are written to the file and read back from it."""
+        path = os.path.join(self.dir, 'profiles.json')
+        profiles = SiteProfiles(path, max_hosts=1)
+        self.parse(1, profiles)
+        self.parse(1, profiles, host='other.example.com')
+        profiles.save()
+        profiles = pickle.loads(pickle.dumps(SiteProfiles(path)))
+        self.assertEqual(1, len(profiles))
+        self.assertEqual('profile', self.parse(2, profiles, host='other.example.com').parsed_by)
+        self.assertEqual('ruthless', self.parse(2, profiles).parsed_by)
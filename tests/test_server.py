@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+import unittest
+
+from readability.server import ArticleService
+from readability.server import Overloaded
+from readability.server import create_app
+from tests.stub_server import StubServer
+from tests.stub_server import article_page
+
+
+class TestServer(unittest.TestCase):
+    """
+    The web service extracts articles from a fake upstream in a worker pool and caches them.
+    """
+
+    def setUp(self):
+        self.upstream = StubServer({
+            '/story': (article_page('Story'), 0.2),
+            '/index': ('<html><body><a href="/">home</a></body></html>', 0),
+        })
+        self.service = ArticleService(workers=2, ttl=60)
+        self.client = create_app(self.service).test_client()
+
+    def tearDown(self):
+        self.upstream.stop()
+
+    def get(self, path):
+        return self.client.get('/?url=' + self.upstream.url(path))
+
+    def test_article_is_cached(self):
+        """A second request for the same url is answered without going upstream."""
+        for i in range(2):
+            response = self.get('/story')
+            self.assertEqual(200, response.status_code)
+            self.assertIn('Story paragraph 0', response.data)
+        self.assertEqual(['/story'], self.upstream.requests)
+        self.assertEqual(1, self.service.counts['cache_hits'])
+
+    def test_concurrent_requests_are_deduplicated(self):
+        """Requests for a url that is being extracted wait for that extraction instead of starting another."""
+        responses = []
+        threads = [threading.Thread(target=lambda: responses.append(self.service.article(self.upstream.url('/story'))))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(responses))
+        self.assertEqual(1, len(set(responses)))
+        self.assertEqual(['/story'], self.upstream.requests)
+        self.assertEqual(3, self.service.counts['deduplicated'])
+
+    def test_overloaded(self):
+        """Requests sharing an extraction count against max_pending like the one that started it."""
+        self.service.max_pending = 2
+        errors = []
+
+        def article():
+            try:
+                self.service.article(self.upstream.url('/story'))
+            except Overloaded as e:
+                errors.append(e)
+        threads = [threading.Thread(target=article) for i in range(3)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(errors))
+        self.assertEqual(1, self.service.counts['overloaded'])
+        self.assertEqual(0, self.service.metrics()['waiting'])
+
+    def test_unchanged_page_is_not_extracted_again(self):
+        """Once the ttl is over the page is fetched again, but only extracted if its content changed."""
+        self.service.hashes.ttl = 0
+        self.get('/story')
+        time.sleep(0.01)
+        self.get('/story')
+        self.assertEqual(1, self.service.counts['extracted'])
+        self.assertEqual(1, self.service.counts['revalidated'])
+        self.upstream.pages['/story'] = (article_page('Changed'), 0)
+        time.sleep(0.01)
+        self.assertIn('Changed paragraph 0', self.get('/story').data)
+        self.assertEqual(2, self.service.counts['extracted'])
+
+    def test_not_article(self):
+        self.assertEqual('not article', self.get('/index').data)
+        self.assertEqual(1, self.service.counts['not_article'])
+
+    def test_errors(self):
+        """Missing urls are a bad request, unreachable pages a bad gateway."""
+        self.assertEqual(400, self.client.get('/').status_code)
+        self.assertEqual(502, self.client.get('/?url=http://127.0.0.1:1/').status_code)
+
+    def test_health_and_metrics(self):
+        self.assertEqual('ok', json.loads(self.client.get('/health').data)['status'])
+        before = json.loads(self.client.get('/metrics').data)['encoding'].get('http', 0)
+        self.get('/story')
+        metrics = json.loads(self.client.get('/metrics').data)
+        self.assertEqual(1, metrics['requests'])
+        self.assertEqual(1, metrics['extracted'])
+        self.assertEqual(0, metrics['pending'])
+        self.assertEqual(0, metrics['waiting'])
+        self.assertEqual(1, metrics['cache']['entries'])
+        self.assertGreater(metrics['features']['entries'], 0)
+        # the stub server serves its pages with a charset
+        self.assertEqual(before + 1, metrics['encoding']['http'])
@@ -0,0 +1,99 @@
+import json
+import logging
+import unittest
+from StringIO import StringIO
+
+from readability import Document
+from readability import utils
+from readability.tracing import Timings
+from readability.tracing import Trace
+from tests.test_article_only import load_sample
+
+
+class TestTrace(unittest.TestCase):
+    """
+    A trace records the scoring decisions without changing the article.
+    """
+
+    def test_records_decisions(self):
+        trace = Trace()
+        sample = load_sample('si-game.sample.html')
+        traced = Document('http://example.com/', sample, trace=trace).get_clean_article()
+        self.assertEqual(Document('http://example.com/', sample).get_clean_article(), traced)
+
+        kinds = [event['event'] for event in trace.events]
+        self.assertEqual('document', kinds[0])
+        self.assertIn('pass', kinds)
+        self.assertIn('candidate', kinds)
+        self.assertIn('best', kinds)
+        self.assertEqual('result', kinds[-1])
+        candidate = [event for event in trace.events if event['event'] == 'candidate'][0]
+        self.assertTrue(candidate['path'].startswith('/html'))
+        self.assertAlmostEqual(candidate['score'] * (1 - candidate['link_density']), candidate['final_score'])
+
+    def test_write(self):
+        trace = Trace()
+        trace.record('pass', ruthless=True)
+        stream = StringIO()
+        trace.write(stream)
+        self.assertEqual([{'event': 'pass', 'ruthless': True}], [json.loads(l) for l in stream.getvalue().splitlines()])
+
+
+class TestTimings(unittest.TestCase):
+    """
+    A timer sees every stage of the work, and the document knows which pass found the article.
+    """
+
+    def test_stages(self):
+        timings = Timings()
+        doc = Document('http://example.com/', load_sample('wired.sample.html'), timer=timings)
+        doc.get_clean_article()
+        self.assertEqual('ruthless', doc.parsed_by)
+        self.assertEqual(['build_doc', 'clean', 'make_links_absolute', 'find_unlikely', 'ruthless:copy',
+                          'ruthless:transform_divs', 'ruthless:index', 'ruthless:score_paragraphs',
+                          'ruthless:get_article', 'ruthless:sanitize', 'parsed_by_ruthless'], list(timings.stages))
+        self.assertEqual(1, timings.stages['clean']['calls'])
+        self.assertTrue(timings.stages['build_doc']['nodes'] > timings.stages['ruthless:sanitize']['nodes'] > 0)
+        self.assertTrue(0 < timings.total())
+
+    def test_conservative_pass(self):
+        paragraph = '<p>%s</p>' % ('All of the text on this page is in a block that looks like comments, ' * 3)
+        timings = Timings()
+        doc = Document('http://example.com/', '<html><body><div class="comments">%s</div></body></html>'
+                       % (paragraph * 5), timer=timings)
+        self.assertTrue(doc.article is not None)
+        self.assertEqual('conservative', doc.parsed_by)
+        self.assertIn('conservative:sanitize', timings.stages)
+        self.assertIn('parsed_by_conservative', timings.stages)
+
+    def test_conservative_pass_skipped_without_text(self):
+        """Leaving out unlikely candidates without any text can't be why the ruthless pass found nothing."""
+        timings = Timings()
+        doc = Document('http://example.com/', '<html><body><div class="menu"><a href="/"><img src="a.png"></a></div>'
+                       '<div>short</div></body></html>', timer=timings)
+        self.assertEqual(None, doc.article)
+        self.assertEqual(None, doc.parsed_by)
+        self.assertIn('ruthless:score_paragraphs', timings.stages)
+        self.assertNotIn('conservative:copy', timings.stages)
+
+
+class TestLazyLogging(unittest.TestCase):
+    """
+    Nodes aren't described for debug messages nobody will see.
+    """
+
+    def test_describe_not_called_when_debug_is_off(self):
+        calls = []
+        describe = utils.describe
+        utils.describe = lambda *a: calls.append(a) or describe(*a)
+        level = utils.log.level
+        try:
+            utils.log.setLevel(logging.INFO)
+            Document('http://example.com/', load_sample('si-game.sample.html')).get_clean_article()
+            self.assertEqual([], calls)
+            utils.log.setLevel(logging.DEBUG)
+            Document('http://example.com/', load_sample('si-game.sample.html')).get_clean_article()
+            self.assertNotEqual([], calls)
+        finally:
+            utils.describe = describe
+            utils.log.setLevel(level)
@@ -0,0 +1,288 @@
+import unittest
+from copy import deepcopy
+
+from lxml.etree import tostring as etree_tostring
+from lxml.html import document_fromstring
+from lxml.html import fragment_fromstring
+from lxml.html import tostring
+
+from readability import utils
+from readability.htmls import build_doc
+from tests.test_article_only import load_sample
+
+
+class TestTextIndex(unittest.TestCase):
+    """
+    The TextIndex has to agree with the text_content() based helpers it replaces.
+    """
+
+    def assertMatchesTree(self, root, index):
+        for elem in root.iter('*'):
+            self.assertEqual(utils.text_length(elem), index.text_length(elem))
+            self.assertEqual(elem.text_content().count(','), index.comma_count(elem))
+            self.assertEqual(utils.get_link_density(elem), index.link_density(elem))
+
+    def test_samples(self):
+        """Every node of the sample pages gets the same numbers."""
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            doc, enc = build_doc(load_sample(sample))
+            self.assertMatchesTree(doc, utils.TextIndex(doc))
+
+    def test_whitespace_between_nodes(self):
+        """Whitespace is collapsed across node boundaries just like clean() does on the whole text."""
+        doc = fragment_fromstring(
+            u'<div> \n <p>one,  two</p>  <p>\tthree</p>\n\t<a>four <b> five</b></a> \xa0<span>  </span> six \n</div>')
+        self.assertMatchesTree(doc, utils.TextIndex(doc))
+
+    def test_drop_tree(self):
+        """Dropping nodes through the index keeps the ancestors up to date."""
+        doc = document_fromstring(
+            '<html><body><div><p>first, para <a>link</a></p> tail <div><p>second, <a>more links</a></p>'
+            '<span>x</span> end</div></div></body></html>')
+        for keep_pieces in [True, False]:
+            root = deepcopy(doc)
+            index = utils.TextIndex(root, keep_pieces=keep_pieces)
+            for elem in list(root.iter('a', 'span')):
+                index.drop_tree(elem)
+                self.assertMatchesTree(root, index)
+
+    def test_new_nodes_are_indexed_on_demand(self):
+        """Elements created after the index was built are picked up when they are first asked about."""
+        doc = document_fromstring('<html><body><p>some text, here</p><p>more <a>text</a></p></body></html>')
+        index = utils.TextIndex(doc)
+        output = fragment_fromstring('<div/>')
+        for p in list(doc.iter('p')):
+            output.append(p)
+        self.assertEqual(utils.text_length(output), index.text_length(output))
+        self.assertEqual(utils.get_link_density(output), index.link_density(output))
+
+
+class TestUnlikelyCandidates(unittest.TestCase):
+    """
+    The ruthless pass records unlikely candidates and copies around them instead of dropping them from a copy.
+    """
+
+    def test_pruned_copy_matches_remove_unlikely_candidates(self):
+        """Leaving the candidates out of the copy gives the same tree as dropping them, and the original is kept."""
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            doc, enc = build_doc(load_sample(sample))
+            before = tostring(doc)
+            pruned = utils.pruned_copy(doc, utils.find_unlikely_candidates(doc))
+            self.assertEqual(before, tostring(doc))
+            self.assertEqual(tostring(utils.remove_unlikely_candidates(deepcopy(doc))), tostring(pruned))
+
+    def test_tails_are_kept(self):
+        """Text following a dropped candidate stays where drop_tree would put it."""
+        doc = document_fromstring(
+            '<html><body><div>a<span class="sidebar">b</span>c<span class="social">d</span>e</div></body></html>')
+        pruned = utils.pruned_copy(doc, utils.find_unlikely_candidates(doc))
+        self.assertEqual('ace', pruned.find('.//div').text_content())
+
+    def test_restored_copy_shares_the_index(self):
+        """The full copy is a plain deep copy, and the index of the pruned one serves it for everything unchanged."""
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            doc, enc = build_doc(load_sample(sample))
+            unlikely = utils.find_unlikely_candidates(doc)
+            nodes = []
+            pruned = utils.transform_misused_divs_into_paragraphs(utils.pruned_copy(doc, unlikely, nodes))
+            restored, same = utils.restored_copy(doc, unlikely, nodes)
+            self.assertEqual(tostring(deepcopy(doc)), tostring(restored))
+            self.assertTrue(len(same) > len(nodes) / 2)
+
+            known = utils.TextIndex(pruned).shared_with(same)
+            restored = utils.transform_misused_divs_into_paragraphs(restored)
+            index = utils.TextIndex(restored, known)
+            fresh = utils.TextIndex(restored)
+            for elem in restored.iter('*'):
+                self.assertEqual(fresh._get(elem), index._get(elem))
+
+
+class TestMisusedDivs(unittest.TestCase):
+    """
+    Divs are turned into paragraphs based on a structural check rather than serializing their children.
+    """
+
+    def serialized_check(self, div):
+        """The check transform_misused_divs_into_paragraphs used to make on every div."""
+        return utils.REGEXES['divToPElementsRe'].search(unicode(''.join(map(etree_tostring, list(div)))))
+
+    def test_same_divs_are_transformed(self):
+        """The divs that become paragraphs are the ones the serialized check picked."""
+        for sample in ['si-game.sample.html', 'wired.sample.html']:
+            doc, enc = build_doc(load_sample(sample))
+            expected = [div for div in doc.iter('div') if not self.serialized_check(div)]
+            self.assertTrue(expected)
+            utils.transform_misused_divs_into_paragraphs(doc)
+            self.assertTrue(all(div.tag == 'p' for div in expected))
+            self.assertFalse([div for div in doc.iter('div') if div in expected])
+
+    def test_nested_blocks(self):
+        """Blocks anywhere below a div keep it a div, including tags that merely start like a block tag."""
+        doc = document_fromstring(
+            '<html><body><div id="a"><span><img src="x.png"></span></div><div id="b"><abbr>x</abbr></div>'
+            '<div id="c"><span>text <b>only</b></span></div></body></html>')
+        utils.transform_misused_divs_into_paragraphs(doc)
+        self.assertEqual(['div', 'div', 'p'], [doc.get_element_by_id(i).tag for i in 'abc'])
+
+
+class TestTags(unittest.TestCase):
+    """
+    The tags are found in one walk but still come name by name, as the findall per name used to give them.
+    """
+
+    def findall_tags(self, node, *tag_names):
+        """What tags used to do."""
+        for tag_name in tag_names:
+            for e in node.findall('.//%s' % tag_name):
+                yield e
+
+    def test_same_order(self):
+        doc, enc = build_doc(load_sample('wired.sample.html'))
+        names = ('table', 'ul', 'div')
+        self.assertEqual(list(self.findall_tags(doc, *names)), list(utils.tags(doc, *names)))
+        self.assertEqual(list(reversed(doc.findall('.//div'))), list(utils.reverse_tags(doc, 'div')))
+
+    def test_dropped_elements_are_left_out_of_later_names(self):
+        """Like the findall made when it is their name's turn, but not within the name they were dropped in."""
+        html = ('<html><body><div id="a"><div id="b"><ul><li>x</li></ul></div></div>'
+                '<ul id="c"><li>y</li></ul></body></html>')
+        found = {}
+        for name, find in [('old', self.findall_tags), ('new', utils.tags)]:
+            doc = document_fromstring(html)
+            found[name] = []
+            for e in find(doc, 'div', 'ul'):
+                found[name].append(e.get('id'))
+                if e.get('id') == 'a':
+                    e.drop_tree()
+        self.assertEqual(['a', 'b', 'c'], found['new'])
+        self.assertEqual(found['old'], found['new'])
+
+
+class TestTagCounts(unittest.TestCase):
+    """
+    The counts match a findall per element and name, also after nodes are dropped.
+    """
+
+    names = ['p', 'img', 'li', 'a', 'embed', 'input']
+
+    def assertMatchesTree(self, root, counts):
+        for elem in root.iter('*'):
+            self.assertEqual(dict((name, len(elem.findall('.//%s' % name))) for name in self.names),
+                             counts.get(elem))
+
+    def test_sample(self):
+        doc, enc = build_doc(load_sample('si-game.sample.html'))
+        self.assertMatchesTree(doc, utils.TagCounts(doc, self.names))
+
+    def test_drop_tree(self):
+        doc, enc = build_doc(load_sample('wired.sample.html'))
+        index = utils.TextIndex(doc)
+        counts = utils.TagCounts(doc, self.names)
+        for elem in list(doc.iter('ul', 'li'))[::3]:
+            if utils.still_inside([elem], doc):
+                counts.drop_tree(elem, index)
+        self.assertMatchesTree(doc, counts)
+
+
+class TestCandidate(unittest.TestCase):
+    """
+    Candidates are slotted objects that can still be used like the dicts they replace.
+    """
+
+    def test_dict_access(self):
+        """content_score and elem can be read and set as keys as well as attributes, other keys can't."""
+        elem = fragment_fromstring('<div class="article"><p>text</p></div>')
+        candidate = utils.score_node(elem)
+        self.assertIs(elem, candidate['elem'])
+        self.assertEqual(30, candidate['content_score'])
+        candidate['content_score'] += 1.5
+        self.assertEqual(31.5, candidate.content_score)
+        self.assertRaises(KeyError, candidate.__getitem__, 'score')
+        self.assertRaises(KeyError, candidate.__setitem__, 'score', 1)
+        self.assertFalse(hasattr(candidate, '__dict__'))
+
+
+class TestFeatureCache(unittest.TestCase):
+    """
+    The feature cache gives what the regexes give, once for every class and id string.
+    """
+
+    def test_same_as_regexes(self):
+        """Every element of a sample page gets the weight and verdict of running the regexes on it."""
+        cache = utils.FeatureCache()
+        doc, enc = build_doc(load_sample('wired.sample.html'))
+        for elem in doc.iter('*'):
+            for feature in [elem.get('class'), elem.get('id')]:
+                if feature:
+                    weight = 0
+                    if utils.REGEXES['negativeRe'].search(feature):
+                        weight -= 25
+                    if utils.REGEXES['positiveRe'].search(feature):
+                        weight += 25
+                    self.assertEqual(weight, cache.weight(feature))
+            features = '%s %s' % (elem.get('class', ''), elem.get('id', ''))
+            unlikely = bool(utils.REGEXES['unlikelyCandidatesRe'].search(features)
+                            and not utils.REGEXES['okMaybeItsACandidateRe'].search(features))
+            self.assertEqual(unlikely, cache.unlikely(features))
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], stats['misses'])
+        self.assertGreater(stats['hits'], stats['misses'])
+
+    def test_bounded(self):
+        """A full cache starts over rather than growing."""
+        cache = utils.FeatureCache(max_entries=2)
+        for feature in ['article', 'sidebar', 'comment', 'article']:
+            cache.weight(feature)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(25, cache.weight('article'))
+        self.assertEqual(1, cache.hits)
+
+
+class TestRemoveBoilerplate(unittest.TestCase):
+    """
+    Blocks repeated once per page are removed from multi-page articles.
+    """
+
+    def build_article(self, pages):
+        article = fragment_fromstring('<div/>')
+        for page in range(pages):
+            article.append(fragment_fromstring(
+                '<div><div class="share">Share:<div>this\n  story</div></div>'
+                '<p>Page %d of the story.</p><aside>Related: other stories</aside></div>' % page))
+        return article
+
+    def test_repeated_blocks_are_removed(self):
+        """Blocks seen once per page go, even if they only differ in whitespace; nested ones go with them."""
+        article = self.build_article(3)
+        article.find('.//aside').text = ' Related:   other stories '
+        utils.remove_boilerplate(article, 3)
+        text = article.text_content()
+        self.assertNotIn('Share', text)
+        self.assertNotIn('Related', text)
+        self.assertEqual(3, text.count('of the story'))
+
+    def test_blocks_not_repeated_per_page_are_kept(self):
+        """Blocks that show up a different number of times than there are pages stay."""
+        article = self.build_article(2)
+        utils.remove_boilerplate(article, 3)
+        self.assertEqual(2, article.text_content().count('Related'))
+
+
+class TestPagingUrl(unittest.TestCase):
+
+    def score(self, href, text='next'):
+        return utils.score_possible_paging_url('http://example.com/story/1', fragment_fromstring(
+            '<a href="%s">%s</a>' % (href, text)), 2)
+
+    def test_next_page(self):
+        self.assertEqual(2, self.score('http://example.com/story/2'))
+        self.assertEqual(3, self.score('http://example.com/story/2', '2'))
+        self.assertEqual(1, self.score('http://example.com/story/page/2', 'more'))
+
+    def test_not_next_page(self):
+        self.assertEqual(0, self.score('http://example.com/story/3'))
+        self.assertEqual(0, self.score('http://example.com/story/12'))
+        self.assertEqual(0, self.score('http://other.com/story/2'))
+        self.assertEqual(0, self.score('http://example.com/story/2#comments'))
+        self.assertEqual(False, utils.score_possible_paging_url('http://example.com/', fragment_fromstring('<a>x</a>'), 2))